@@ -0,0 +1,389 @@
+import logging
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+import streamlit_app as app
+
+
+def medir(funcao, repeticoes=3):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos)
+
+
+def pacientes_sinteticos(n, semente=42):
+    gerador = np.random.default_rng(semente)
+    nascimentos = pd.Timestamp("1920-01-01") + pd.to_timedelta(gerador.integers(0, 365 * 100, n), unit="D")
+    datas = pd.Series(nascimentos.strftime("%d/%m/%Y"))
+    invalidas = gerador.random(n) < 0.05
+    datas[invalidas] = gerador.choice(["", "sem data", "31/02/1990"], invalidas.sum())
+    df = pd.DataFrame({col: [""] * n for col in app.COLUNAS_PACIENTES})
+    df["ID"] = [f"ID-{i}" for i in range(n)]
+    df["Nome Completo"] = [f"Paciente {i}" for i in range(n)]
+    df["Data de Nascimento"] = datas
+    return df
+
+
+def bench_idades(n=100_000):
+    base = pacientes_sinteticos(n)
+
+    def por_linha():
+        df = base.copy()
+        df["Idade"] = df.apply(
+            lambda row: row["Idade"] if str(row.get("Idade", "")).strip() != "" else app.calcular_idade_por_data(row.get("Data de Nascimento", "")),
+            axis=1,
+        )
+        return df
+
+    def vetorizado():
+        return app.garantir_colunas_pacientes(base.copy())
+
+    antigo = pd.to_numeric(por_linha()["Idade"], errors="coerce").astype("Int64")
+    novo = vetorizado()["Idade"]
+    assert antigo.equals(novo), "idades divergentes entre as duas implementações"
+
+    t_linha = medir(por_linha, repeticoes=1)
+    t_vetor = medir(vetorizado)
+    print(f"Idades ({n} linhas): apply por linha {t_linha:.3f}s | vetorizado {t_vetor:.3f}s | {t_linha / t_vetor:.0f}x")
+
+
+def bench_busca(n=100_000):
+    df = app.garantir_colunas_pacientes(
+        app.tipar_quadro("pacientes", pd.DataFrame(app.pacientes_ficticios(n), columns=app.COLUNAS_PACIENTES))
+    )
+    inicio = time.perf_counter()
+    indice = app.IndiceBusca(df)
+    t_indice = time.perf_counter() - inicio
+    consultas = ["João", "joao", "Concicao Riberio", "FAM00042", "12345", "maria santos"]
+    t_contains = medir(lambda: [df["Nome Completo"].astype(str).str.contains(c, case=False, na=False) for c in consultas])
+    t_busca = medir(lambda: [indice.buscar(c) for c in consultas])
+    print(
+        f"Busca ({n} pacientes, {len(consultas)} consultas): índice construído em {t_indice:.3f}s | "
+        f"str.contains {t_contains * 1000 / len(consultas):.2f}ms/consulta | índice {t_busca * 1000 / len(consultas):.2f}ms/consulta"
+    )
+
+
+def bench_duplicatas(tamanhos=(15_000, 100_000)):
+    for n in tamanhos:
+        linhas = app.pacientes_ficticios(n)
+        repetidas = [[f"ID-R{i}"] + linha[1:] for i, linha in enumerate(linhas[::50])]
+        df = app.garantir_colunas_pacientes(
+            app.tipar_quadro("pacientes", pd.DataFrame(linhas + repetidas, columns=app.COLUNAS_PACIENTES))
+        )
+        inicio = time.perf_counter()
+        motor = app.MotorDuplicatas(df)
+        grupos = motor.grupos()
+        t_lote = time.perf_counter() - inicio
+        novo = dict(zip(app.COLUNAS_PACIENTES, linhas[len(linhas) // 2]))
+        t_checagem = medir(lambda: motor.candidatos(novo))
+        print(
+            f"Duplicatas ({n} pacientes + {len(repetidas)} repetidos): {len(grupos)} grupos em {t_lote:.3f}s | "
+            f"checagem antes de salvar {t_checagem * 1000:.2f}ms"
+        )
+
+
+MODULOS_PESADOS = [
+    "gspread",
+    "google.oauth2.service_account",
+    "google.genai",
+    "matplotlib.pyplot",
+    "reportlab.pdfgen.canvas",
+    "pypdf",
+    "qrcode",
+    "pdf2image",
+]
+
+
+def medir_em_processo_novo(importacoes, preparo=("streamlit", "pandas")):
+    codigo = (
+        "import sys, time\n"
+        + "".join(f"import {modulo}\n" for modulo in preparo)
+        + "inicio = time.perf_counter()\n"
+        + "".join(f"import {modulo}\n" for modulo in importacoes)
+        + "print(time.perf_counter() - inicio)\n"
+        + f"print(','.join(m for m in {MODULOS_PESADOS!r} if m in sys.modules))\n"
+    )
+    saida = subprocess.run(
+        [sys.executable, "-c", codigo],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    ).stdout.splitlines()
+    return float(saida[0]), [modulo for modulo in saida[1].split(",") if modulo]
+
+
+def bench_importacao(repeticoes=3):
+    medicoes = [medir_em_processo_novo(["streamlit_app"]) for _ in range(repeticoes)]
+    t_app = min(tempo for tempo, _ in medicoes)
+    carregados = medicoes[0][1]
+    t_pesados = min(medir_em_processo_novo(MODULOS_PESADOS)[0] for _ in range(repeticoes))
+    print(
+        f"Importação (após streamlit e pandas): streamlit_app {t_app:.3f}s | "
+        f"módulos pesados que deixaram de ser carregados na partida {t_pesados:.3f}s | "
+        f"pesados carregados pelo app: {', '.join(carregados) or 'nenhum'}"
+    )
+    assert not carregados, f"módulos pesados importados na carga do app: {carregados}"
+
+
+def preparar_armazenamentos(n, latencia=0.0):
+    app.CAMINHO_ESPELHO = os.path.join(tempfile.mkdtemp(), "espelho.sqlite3")
+    app.conectar_espelho.clear()
+    app.estado_espelho.clear()
+    app.fila_escrita.clear()
+    aba_pacientes = app.ArmazenamentoPlanilha(
+        app.AbaFalsa("Página1", app.COLUNAS_PACIENTES, app.pacientes_ficticios(n), latencia=latencia),
+        opcao_anexo="USER_ENTERED",
+    )
+    aba_kanban = app.ArmazenamentoPlanilha(app.AbaFalsa("KANBAN", app.COLUNAS_KANBAN, latencia=latencia))
+    return aba_pacientes, aba_kanban
+
+
+def bench_paginas(tamanhos=(1_000, 10_000, 100_000), latencia=0.0):
+    logging.disable(logging.WARNING)
+    for n in tamanhos:
+        aba_pacientes, aba_kanban = preparar_armazenamentos(n, latencia)
+        inicio = time.perf_counter()
+        app.carregar_dados_aba(aba_pacientes)
+        t_inicial = time.perf_counter() - inicio
+        paginas = {
+            "carga em cache": lambda: app.carregar_dados_aba(aba_pacientes),
+            "menu": lambda: app.pagina_menu(aba_pacientes, aba_kanban),
+            "dashboard": lambda: app.pagina_dashboard_pacientes(aba_pacientes),
+            "whatsapp": lambda: app.pagina_whatsapp(aba_pacientes),
+            "etiquetas": lambda: app.pagina_etiquetas_qrcode(aba_pacientes),
+            "gestão": lambda: app.pagina_gestao_pacientes(aba_pacientes),
+        }
+        tempos = " | ".join(f"{nome} {medir(funcao, repeticoes=1):.3f}s" for nome, funcao in paginas.items())
+        chamadas = aba_pacientes.aba.chamadas
+        print(f"Páginas ({n} pacientes): sincronização inicial {t_inicial:.3f}s | {tempos} | chamadas à planilha {chamadas}")
+
+
+def bench_campanha(tamanhos=(1_000, 100_000)):
+    mensagem = "Olá, [NOME]! [NOME_COMPLETO], [IDADE], da família [FAMILIA]: vacinação dia 20. Dúvidas? Ligue 2641-1499."
+
+    def substituir_por_linha(dados):
+        substituicoes = {
+            "[NOME]": dados.get("Nome Completo", "").split()[0] if dados.get("Nome Completo") else "",
+            "[NOME_COMPLETO]": dados.get("Nome Completo", "Não Informado"),
+            "[IDADE]": f"{dados.get('Idade') if pd.notna(dados.get('Idade')) else 'N/A'} anos",
+            "[CPF]": dados.get("CPF", "Não Informado"),
+            "[CNS]": dados.get("CNS", "Não Informado"),
+            "[DATA_NASCIMENTO]": dados.get("Data de Nascimento", "Não Informado"),
+            "[TELEFONE]": dados.get("Telefone", "Não Informado"),
+            "[CONDICOES]": dados.get("Condição", "Nenhuma registrada"),
+            "[MEDICAMENTOS]": dados.get("Medicamentos", "Nenhum registrado"),
+            "[FAMILIA]": dados.get("FAMÍLIA", "N/A"),
+            "[MUNICIPIO_NASC]": dados.get("Município de Nascimento", "N/A"),
+        }
+        texto = mensagem
+        for marcador, valor in substituicoes.items():
+            texto = texto.replace(marcador, str(valor))
+        return f"https://wa.me/55{dados['_telefone']}?text={app.urllib.parse.quote(texto)}"
+
+    for n in tamanhos:
+        df = app.garantir_colunas_pacientes(
+            app.tipar_quadro("pacientes", pd.DataFrame(app.pacientes_ficticios(n), columns=app.COLUNAS_PACIENTES))
+        )
+        df = df[df["_telefone_valido"]]
+        antigo = [substituir_por_linha(dados) for dados in df.to_dict("records")]
+        assert antigo == app.montar_campanha(df, mensagem)["Link"].tolist(), "links divergentes entre as duas implementações"
+        t_linha = medir(lambda: [substituir_por_linha(dados) for dados in df.to_dict("records")], repeticoes=1)
+        t_campanha = medir(lambda: app.montar_campanha(df, mensagem))
+        print(f"Campanha ({len(df)} mensagens): substituição por linha {t_linha:.3f}s | modelo compilado {t_campanha:.3f}s")
+
+
+def bench_telefones(n=100_000):
+    telefones = pd.Series(app.pacientes_ficticios(n)).str[app.COLUNAS_PACIENTES.index("Telefone")]
+    telefones[::7] = "+55 (21) 9999-888"
+    telefones[::11] = ""
+
+    def padronizar_telefone(telefone):
+        if pd.isna(telefone) or telefone == "":
+            return None
+        num_limpo = app.re.sub(r"\D", "", str(telefone))
+        if num_limpo.startswith("55"):
+            num_limpo = num_limpo[2:]
+        if 10 <= len(num_limpo) <= 11:
+            return num_limpo
+        return None
+
+    def vetorizado():
+        padronizados = app.padronizar_telefones(telefones)
+        return padronizados.where(padronizados.str.len().between(10, 11))
+
+    antigo = telefones.apply(padronizar_telefone)
+    assert antigo.fillna("").tolist() == vetorizado().fillna("").tolist(), "telefones divergentes entre as duas implementações"
+    t_linha = medir(lambda: telefones.apply(padronizar_telefone), repeticoes=1)
+    t_vetor = medir(vetorizado)
+    print(f"Telefones ({n} linhas): apply por linha {t_linha:.3f}s | vetorizado {t_vetor:.3f}s | {t_linha / t_vetor:.0f}x")
+
+
+def bench_etiquetas(n=2_000, links=300):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+    import qrcode
+
+    for link in [f"https://drive.google.com/drive/folders/pasta{i:05d}" for i in range(5)]:
+        tamanho, trechos = app.modulos_qrcode(link)
+        matriz = [[False] * tamanho for _ in range(tamanho)]
+        for linha, coluna, comprimento in trechos:
+            matriz[linha][coluna:coluna + comprimento] = [True] * comprimento
+        qr = qrcode.QRCode(version=1, border=2)
+        qr.add_data(link)
+        qr.make(fit=True)
+        assert matriz == qr.get_matrix(), "matriz do QR Code divergente"
+
+    membros = [{"Nome Completo": "Paciente", "Data de Nascimento": "01/01/1990", "CNS": "700000000000000"}]
+    familias = {
+        f"FAM{i:05d}": {"membros": membros, "link_pasta": f"https://drive.google.com/drive/folders/pasta{i % links:05d}"}
+        for i in range(n)
+    }
+
+    def rasterizado():
+        buffer = BytesIO()
+        can = canvas.Canvas(buffer, pagesize=A4)
+        for i, dados in enumerate(familias.values()):
+            qr = qrcode.QRCode(version=1, box_size=8, border=2)
+            qr.add_data(dados["link_pasta"])
+            qr.make(fit=True)
+            imagem = BytesIO()
+            qr.make_image(fill_color="black", back_color="white").save(imagem, format="PNG")
+            imagem.seek(0)
+            can.drawImage(ImageReader(imagem), 0.5 * cm, (i % 10) * 2.8 * cm, width=2.5 * cm, height=2.5 * cm)
+            if i % 10 == 9:
+                can.showPage()
+        can.save()
+        return buffer.getbuffer().nbytes
+
+    t_raster = medir(rasterizado, repeticoes=1)
+    tamanho_raster = rasterizado()
+    app.modulos_qrcode.cache_clear()
+    t_frio = medir(lambda: app.gerar_pdf_etiquetas(familias), repeticoes=1)
+    t_quente = medir(lambda: app.gerar_pdf_etiquetas(familias))
+    tamanho_vetor = app.gerar_pdf_etiquetas(familias).getbuffer().nbytes
+    print(
+        f"Etiquetas ({n} famílias, {links} pastas): QR rasterizado {t_raster:.3f}s ({tamanho_raster / 1e6:.1f} MB) | "
+        f"vetorial {t_frio:.3f}s, reimpressão {t_quente:.3f}s ({tamanho_vetor / 1e6:.1f} MB)"
+    )
+
+
+def bench_capas(n=5_000):
+    from pypdf import PdfReader
+
+    df = pd.DataFrame(app.pacientes_ficticios(n), columns=app.COLUNAS_PACIENTES)
+    processos = os.cpu_count() or 1
+    t_unico = medir(lambda: app.gerar_pdf_capas_prontuario(df), repeticoes=1)
+    tamanho = app.gerar_pdf_capas_prontuario(df).getbuffer().nbytes
+    inicio = time.perf_counter()
+    arquivo = app.gerar_pdf_capas_em_lotes(df)
+    t_lotes = time.perf_counter() - inicio
+    em_disco = arquivo._rolled
+    with zipfile.ZipFile(arquivo) as arquivo_zip:
+        paginas = sum(len(PdfReader(arquivo_zip.open(nome)).pages) for nome in arquivo_zip.namelist())
+        tamanho_zip = sum(info.compress_size for info in arquivo_zip.infolist())
+    arquivo.close()
+    assert paginas == n, f"{paginas} capas geradas para {n} pacientes"
+    print(
+        f"Capas ({n} pacientes): canvas único em memória {t_unico:.3f}s ({tamanho / 1e6:.1f} MB) | "
+        f"lotes de {app.TAMANHO_LOTE_CAPAS} em {min(processos, -(-n // app.TAMANHO_LOTE_CAPAS))} processo(s) {t_lotes:.3f}s | "
+        f"ZIP de {tamanho_zip / 1e6:.1f} MB {'em disco' if em_disco else 'em memória'}"
+    )
+
+
+def bench_familias(n=100_000):
+    df = app.garantir_colunas_pacientes(
+        app.tipar_quadro("pacientes", pd.DataFrame(app.pacientes_ficticios(n), columns=app.COLUNAS_PACIENTES))
+    )
+
+    def agrupar():
+        familias = df[df["FAMÍLIA"].astype(str).str.strip() != ""]
+        return familias.groupby("FAMÍLIA", observed=True).apply(
+            lambda x: {
+                "membros": x[["Nome Completo", "Data de Nascimento", "CNS"]].to_dict("records"),
+                "link_pasta": x["Link da Pasta da Família"].iloc[0],
+            }
+        ).to_dict()
+
+    antigo = agrupar()
+    inicio = time.perf_counter()
+    indice = app.IndiceFamilias(df)
+    t_indice = time.perf_counter() - inicio
+    assert antigo == indice.para_etiquetas(indice.ordenadas), "famílias divergentes entre as duas implementações"
+    t_apply = medir(agrupar, repeticoes=1)
+    t_todas = medir(lambda: indice.para_etiquetas(indice.ordenadas))
+    t_dez = medir(lambda: indice.para_etiquetas(indice.ordenadas[:10]))
+    print(
+        f"Famílias ({n} pacientes, {len(indice.ordenadas)} famílias): groupby.apply {t_apply:.3f}s por rerun | "
+        f"índice construído em {t_indice:.3f}s | etiquetas de todas {t_todas:.3f}s | de 10 famílias {t_dez * 1000:.2f}ms"
+    )
+
+
+def bench_ivcf(n=500):
+    from pypdf import PdfReader, PdfWriter
+
+    pacientes = [
+        {"ID": f"ID-{i}", "Nome Completo": f"Paciente {i}", "CPF": f"{i:011d}", "Data de Nascimento": "01/01/1950"}
+        for i in range(n)
+    ]
+
+    def um_por_vez():
+        mesclado = PdfWriter()
+        for paciente in pacientes:
+            leitor = PdfReader(open(app.CAMINHO_MODELO_IVCF, "rb"))
+            pagina = leitor.pages[0]
+            pagina.merge_page(app.sobreposicoes_ivcf([paciente])[0])
+            mesclado.add_page(pagina)
+        buffer = BytesIO()
+        mesclado.write(buffer)
+        return buffer.getbuffer().nbytes
+
+    inicio = time.perf_counter()
+    tamanho_antigo = um_por_vez()
+    t_antigo = time.perf_counter() - inicio
+    t_lote = medir(lambda: app.preencher_formularios_em_lote(pacientes))
+    lote = app.preencher_formularios_em_lote(pacientes)
+    tamanho_lote = lote.getbuffer().nbytes
+    modelo = PdfReader(app.CAMINHO_MODELO_IVCF).pages[0].extract_text().split("\n")[0]
+    for i, pagina in enumerate(PdfReader(lote).pages):
+        texto = pagina.extract_text()
+        assert modelo in texto, f"página {i} sem o texto do modelo"
+        assert re.findall(r"Paciente \d+", texto) == [f"Paciente {i}"], f"página {i} com dados de outro paciente"
+    print(
+        f"IVCF-20 ({n} formulários): modelo relido por paciente {t_antigo:.3f}s ({tamanho_antigo / 1e6:.1f} MB) | "
+        f"lote com modelo compartilhado {t_lote:.3f}s ({tamanho_lote / 1e6:.1f} MB)"
+    )
+
+
+BENCHMARKS = {
+    "idades": bench_idades,
+    "busca": bench_busca,
+    "duplicatas": bench_duplicatas,
+    "paginas": bench_paginas,
+    "importacao": bench_importacao,
+    "campanha": bench_campanha,
+    "telefones": bench_telefones,
+    "etiquetas": bench_etiquetas,
+    "capas": bench_capas,
+    "familias": bench_familias,
+    "ivcf": bench_ivcf,
+}
+
+
+if __name__ == "__main__":
+    for nome in sys.argv[1:] or list(BENCHMARKS):
+        BENCHMARKS[nome]()
@@ -1,43 +1,66 @@
+import hashlib
 import json
+import os
+import random
 import re
+import sqlite3
+import tempfile
+import threading
 import time
+import unicodedata
 import urllib.parse
 import uuid
+import zipfile
+from bisect import bisect_left
+from collections import Counter, deque
 from datetime import date, datetime
+from functools import lru_cache, partial
+from importlib import import_module
+from importlib.util import find_spec
 from io import BytesIO
+from itertools import combinations
+from types import SimpleNamespace
 
-import gspread
-import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
-import qrcode
 import streamlit as st
-from google.oauth2.service_account import Credentials
-from PIL import Image
-from pypdf import PdfReader, PdfWriter
-from reportlab.lib.colors import HexColor
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import cm
-from reportlab.lib.utils import ImageReader
-from reportlab.pdfgen import canvas
-
-GENAI_OK = True
-PDF2IMAGE_OK = True
-
-try:
-    import google.genai as genai
-    from google.genai.types import Part
-    from pydantic import BaseModel, Field
-except Exception:
-    GENAI_OK = False
 
-try:
-    from pdf2image import convert_from_bytes
-except Exception:
-    PDF2IMAGE_OK = False
+
+def modulo_disponivel(nome):
+    try:
+        return find_spec(nome) is not None
+    except ImportError:
+        return False
+
+
+GENAI_OK = modulo_disponivel("google.genai") and modulo_disponivel("pydantic")
+PDF2IMAGE_OK = modulo_disponivel("pdf2image")
 
 
 MODELO_GEMINI = "gemini-2.5-flash"
 
+TIPO_ARMAZENAMENTO = os.environ.get("COLETA_ARMAZENAMENTO", "planilha")
+CAMINHO_ESPELHO = os.environ.get(
+    "COLETA_ESPELHO_SQLITE",
+    "coleta_espelho.sqlite3" if TIPO_ARMAZENAMENTO == "planilha" else f"coleta_espelho_{TIPO_ARMAZENAMENTO}.sqlite3",
+)
+CAMINHO_ARMAZENAMENTO_SQLITE = os.environ.get("COLETA_ARMAZENAMENTO_SQLITE", "coleta_dados.sqlite3")
+PACIENTES_FICTICIOS = int(os.environ.get("COLETA_PACIENTES_FICTICIOS", "0"))
+LATENCIA_FALSA = float(os.environ.get("COLETA_LATENCIA_FALSA", "0.3"))
+COTA_FALSA_POR_MINUTO = int(os.environ.get("COLETA_COTA_FALSA", "60"))
+COTA_PLANILHA_POR_MINUTO = int(os.environ.get("COLETA_COTA_PLANILHA", "60"))
+TENTATIVAS_COTA = 5
+ESPERA_BASE_COTA = 1.0
+ESPERA_MAXIMA_COTA = 32.0
+CODIGOS_REPETICAO = {429, 500, 502, 503, 504}
+AMOSTRAS_LATENCIA = 1000
+INTERVALO_SINCRONIZACAO = 60
+INTERVALO_RESUMO = 60
+JANELA_ESCRITA = 2.0
+LOTE_MAXIMO_ESCRITA = 50
+INTERVALO_REPRODUCAO = 15
+TENTATIVAS_MAXIMAS_DIARIO = 5
+
 STATUS_OPCOES = ["Backlog", "Para Fazer", "Em Andamento", "Aguardando", "Concluído"]
 PRIORIDADE_OPCOES = ["Baixa", "Média", "Alta", "Urgente"]
 
@@ -90,6 +113,70 @@ COLUNAS_KANBAN = [
     "Atualizado em",
 ]
 
+COLUNAS_CATEGORICAS = {
+    "pacientes": ["FAMÍLIA", "Sexo", "Município de Nascimento", "Município de Residência"],
+    "kanban": ["Status", "Prioridade"],
+}
+
+TAMANHOS_PAGINA_GESTAO = [10, 25, 50, 100]
+TAMANHOS_PAGINA_PAINEL = [25, 50, 100, 250]
+COLUNAS_TABELA_PAINEL = ["ID", "FAMÍLIA", "Nome Completo", "Data de Nascimento", "Idade", "Sexo", "Município de Residência", "Telefone"]
+VARIAVEIS_MENSAGEM = {
+    "NOME": ("Nome Completo", ""),
+    "NOME_COMPLETO": ("Nome Completo", "Não Informado"),
+    "IDADE": ("Idade", "N/A"),
+    "CPF": ("CPF", "Não Informado"),
+    "CNS": ("CNS", "Não Informado"),
+    "DATA_NASCIMENTO": ("Data de Nascimento", "Não Informado"),
+    "TELEFONE": ("Telefone", "Não Informado"),
+    "CONDICOES": ("Condição", "Nenhuma registrada"),
+    "MEDICAMENTOS": ("Medicamentos", "Nenhum registrado"),
+    "FAMILIA": ("FAMÍLIA", "N/A"),
+    "MUNICIPIO_NASC": ("Município de Nascimento", "N/A"),
+}
+PADRAO_VARIAVEL = re.compile(r"\[([A-Z_]+)\]")
+TAMANHO_CACHE_QRCODE = 4096
+CAMINHO_MODELO_IVCF = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "Formulario_2IndiceDeVulnerabilidadeClinicoFuncional20IVCF20_ImpressoraPDFPreenchivel_202404-2.pdf",
+)
+IDADE_MINIMA_IVCF = 60
+TAMANHO_LOTE_CAPAS = 200
+LIMITE_MEMORIA_CAPAS = 32 * 1024 * 1024
+COLUNAS_CAPA = ["Nome Completo", "Data de Nascimento", "FAMÍLIA", "CPF", "CNS", "Telefone", "Sexo", "Condição", "Medicamentos"]
+FAIXAS_ETARIAS = {"Crianças": (0, 12), "Adolescentes": (12, 18), "Adultos": (18, 60), "Idosos": (60, np.inf)}
+
+PESOS_DUPLICATA = {"cpf": 0.4, "cns": 0.4, "nascimento": 0.2, "nome": 0.3, "mae": 0.1}
+LIMIAR_DUPLICATA = 0.55
+TAMANHO_MAXIMO_BLOCO = 50
+GRUPOS_POR_PAGINA = 10
+REGRAS_FONETICAS = [
+    (r"ph", "f"),
+    (r"lh", "l"),
+    (r"nh", "n"),
+    (r"[cs]h", "x"),
+    (r"th", "t"),
+    (r"sc(?=[eiy])", "s"),
+    (r"c(?=[eiy])", "s"),
+    (r"qu?|c", "k"),
+    (r"g(?=[eiy])", "j"),
+    (r"gu(?=[ei])", "g"),
+    (r"z", "s"),
+    (r"y", "i"),
+    (r"w", "v"),
+    (r"h", ""),
+    (r"m\b", "n"),
+    (r"(\w)\1+", r"\1"),
+    (r"\B[aeiou]", ""),
+]
+
+CAMPOS_BUSCA = {"Nome Completo": 1.0, "CPF": 1.0, "CNS": 1.0, "FAMÍLIA": 1.0, "Nome da Mãe": 0.7}
+CAMPOS_BUSCA_APROXIMADA = ["Nome Completo", "Nome da Mãe"]
+CAMPOS_BUSCA_NUMERICOS = {"CPF": "_cpf", "CNS": "_cns"}
+PONTOS_PREFIXO = 0.85
+PONTOS_APROXIMADO = 0.7
+PONTOS_TRECHO_NUMERICO = 0.6
+
 EXAMES_COMUNS = [
     "Hemograma Completo",
     "Glicemia em Jejum",
@@ -173,7 +260,10 @@ CALENDARIO_PNI = [
     {"vacina": "Meningocócica C", "dose": "Reforço", "idade_meses": 12},
 ]
 
-if GENAI_OK:
+@st.cache_resource(show_spinner=False)
+def esquemas_gemini():
+    from pydantic import BaseModel, Field
+
     class CadastroSchema(BaseModel):
         ID: str = Field(description="ID único gerado. Se não for claro, retorne string vazia.")
         FAMÍLIA: str = Field(description="Código de família, ex: FAM111.")
@@ -209,6 +299,13 @@ if GENAI_OK:
     class DicasSaudeSchema(BaseModel):
         dicas: list[DicaSaude]
 
+    return SimpleNamespace(
+        CadastroSchema=CadastroSchema,
+        VacinacaoSchema=VacinacaoSchema,
+        ClinicoSchema=ClinicoSchema,
+        DicasSaudeSchema=DicasSaudeSchema,
+    )
+
 
 def aplicar_estilo():
     st.markdown(
@@ -390,8 +487,18 @@ def botao_voltar_menu():
         st.rerun()
 
 
+@st.cache_resource(show_spinner=False)
+def utilitarios_planilha():
+    import gspread.utils
+
+    return gspread.utils
+
+
 @st.cache_resource
 def conectar_planilha():
+    import gspread
+    from google.oauth2.service_account import Credentials
+
     if "APP_SHEET_ID" not in st.secrets:
         st.error("Falta APP_SHEET_ID nos Secrets do Streamlit.")
         st.stop()
@@ -425,25 +532,1527 @@ def obter_ou_criar_aba(planilha, nome_aba, colunas):
 
 def obter_aba_pacientes(planilha):
     nomes_tentativa = ["Página1", "PACIENTES", "BASE_DE_DADOS", "Pagina1"]
+    abas = {aba.title: aba for aba in planilha.worksheets()}
 
     for nome in nomes_tentativa:
+        if nome not in abas:
+            continue
+        cab = abas[nome].row_values(1)
+        if "Nome Completo" in cab and "CPF" in cab:
+            return abas[nome]
+
+    return obter_ou_criar_aba(planilha, "Página1", COLUNAS_PACIENTES)
+
+
+@st.cache_resource
+def obter_abas(_planilha, planilha_id):
+    return obter_aba_pacientes(_planilha), obter_ou_criar_aba(_planilha, "KANBAN", COLUNAS_KANBAN)
+
+
+@st.cache_resource
+def estado_espelho():
+    return {
+        "trava": threading.RLock(),
+        "em_curso": set(),
+        "versoes": {},
+        "quadros": {},
+        "bases": {},
+        "indices": {},
+        "resumos": {},
+        "sinal_diario": threading.Event(),
+    }
+
+
+@st.cache_resource
+def conectar_espelho():
+    conn = sqlite3.connect(CAMINHO_ESPELHO, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS sincronizacoes (tabela TEXT PRIMARY KEY, sincronizado_em REAL)")
+    for tabela, colunas in [("pacientes", COLUNAS_PACIENTES), ("kanban", COLUNAS_KANBAN)]:
+        definicao = ", ".join(f'"{col}" TEXT' for col in colunas)
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {tabela} ("_linha" INTEGER, "_hash" TEXT, {definicao})')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{tabela}_linha ON {tabela} ("_linha")')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{tabela}_id ON {tabela} ("ID")')
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS diario (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            chave TEXT UNIQUE,
+            tabela TEXT,
+            operacao TEXT,
+            registro_id TEXT,
+            dados TEXT,
+            linha INTEGER,
+            estado TEXT DEFAULT 'pendente',
+            tentativas INTEGER DEFAULT 0,
+            erro TEXT,
+            criado_em REAL,
+            aplicado_em REAL
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_diario_estado ON diario (estado, seq)")
+    conn.execute("CREATE TABLE IF NOT EXISTS resumos (tabela TEXT PRIMARY KEY, valores TEXT, calculado_em REAL)")
+    conn.commit()
+    return conn
+
+
+def estrutura_aba(aba):
+    if aba.title == "KANBAN":
+        return "kanban", COLUNAS_KANBAN
+    return "pacientes", COLUNAS_PACIENTES
+
+
+def hash_registro(registro):
+    return hashlib.sha1("\x1f".join(str(v) for v in registro).encode("utf-8")).hexdigest()
+
+
+def linha_do_intervalo(resposta):
+    try:
+        intervalo = resposta["updates"]["updatedRange"]
+        return int(re.search(r"![A-Z]+(\d+)", intervalo).group(1))
+    except Exception:
+        return None
+
+
+def sincronizar_espelho(aba):
+    tabela, colunas = estrutura_aba(aba)
+    inicio = time.time()
+    valores = aba.ler_todos()
+    cabecalho = valores[0] if valores else []
+    posicoes = [cabecalho.index(col) if col in cabecalho else None for col in colunas]
+
+    remotos = {}
+    for linha, valores_linha in enumerate(valores[1:], start=2):
+        registro = [str(valores_linha[p]) if p is not None and p < len(valores_linha) else "" for p in posicoes]
+        if any(v.strip() for v in registro):
+            remotos[linha] = (hash_registro(registro), registro)
+
+    conn = conectar_espelho()
+    marcadores = ", ".join("?" for _ in range(len(colunas) + 2))
+    with estado_espelho()["trava"], conn:
+        if conn.execute(
+            """
+            SELECT 1 FROM diario
+            WHERE tabela = ? AND (estado IN ('pendente', 'falhou') OR criado_em >= ? OR aplicado_em >= ?)
+            LIMIT 1
+            """,
+            (tabela, inicio, inicio),
+        ).fetchone():
+            return False
+        locais = dict(conn.execute(f'SELECT "_linha", "_hash" FROM {tabela}'))
+        remover = [(linha,) for linha, h in locais.items() if remotos.get(linha, (None,))[0] != h]
+        gravar = [(linha, h, *registro) for linha, (h, registro) in remotos.items() if locais.get(linha) != h]
+        conn.executemany(f'DELETE FROM {tabela} WHERE "_linha" = ?', remover)
+        conn.executemany(f"INSERT INTO {tabela} VALUES ({marcadores})", gravar)
+        conn.execute("INSERT OR REPLACE INTO sincronizacoes VALUES (?, ?)", (tabela, time.time()))
+    return bool(remover or gravar)
+
+
+def agendar_sincronizacao(aba):
+    tabela, _ = estrutura_aba(aba)
+    conn = conectar_espelho()
+    with estado_espelho()["trava"]:
+        if conn.execute(
+            "SELECT 1 FROM diario WHERE tabela = ? AND estado IN ('pendente', 'falhou') LIMIT 1", (tabela,)
+        ).fetchone():
+            return
+        ultima = conn.execute("SELECT sincronizado_em FROM sincronizacoes WHERE tabela = ?", (tabela,)).fetchone()
+        if ultima is not None and time.time() - ultima[0] < INTERVALO_SINCRONIZACAO:
+            return
+        if tabela in estado_espelho()["em_curso"]:
+            return
+        estado_espelho()["em_curso"].add(tabela)
+
+    def executar():
         try:
-            aba = planilha.worksheet(nome)
-            valores = aba.get_all_values()
-            if valores and len(valores) > 0:
-                cab = valores[0]
-                if "Nome Completo" in cab and "CPF" in cab:
-                    return aba
+            if sincronizar_espelho(aba):
+                invalidar_aba(tabela)
         except Exception:
             pass
+        finally:
+            with estado_espelho()["trava"]:
+                estado_espelho()["em_curso"].discard(tabela)
 
-    return obter_ou_criar_aba(planilha, "Página1", COLUNAS_PACIENTES)
+    if ultima is None and not conn.execute(f"SELECT 1 FROM {tabela} LIMIT 1").fetchone():
+        executar()
+    else:
+        threading.Thread(target=executar, daemon=True).start()
+
+
+def invalidar_sincronizacao(tabela):
+    conn = conectar_espelho()
+    with estado_espelho()["trava"], conn:
+        conn.execute("DELETE FROM sincronizacoes WHERE tabela = ?", (tabela,))
+
+
+def versao_aba(aba):
+    tabela, _ = estrutura_aba(aba)
+    return estado_espelho()["versoes"].get(tabela, 0)
+
+
+def invalidar_aba(tabela):
+    estado = estado_espelho()
+    with estado["trava"]:
+        estado["versoes"][tabela] = estado["versoes"].get(tabela, 0) + 1
+        estado["quadros"].pop(tabela, None)
+
+
+def corrigir_quadro_aba(tabela, alterar):
+    estado = estado_espelho()
+    with estado["trava"]:
+        versao = estado["versoes"].get(tabela, 0) + 1
+        estado["versoes"][tabela] = versao
+        quadro = estado["quadros"].get(tabela)
+        if quadro is not None:
+            estado["quadros"][tabela] = (versao, alterar(quadro[1]))
+
+
+def gravar_linha_espelho(aba, linha, dados):
+    tabela, colunas = estrutura_aba(aba)
+    if linha is None:
+        invalidar_sincronizacao(tabela)
+        invalidar_aba(tabela)
+        return
+    registro = [str(dados.get(col, "")) for col in colunas]
+    marcadores = ", ".join("?" for _ in range(len(colunas) + 2))
+
+    def alterar(df):
+        novo = tipar_quadro(tabela, pd.DataFrame([registro], columns=colunas, index=pd.Index([linha], name="_linha")))
+        for col in COLUNAS_CATEGORICAS[tabela]:
+            categorias = df[col].cat.categories.union(novo[col].cat.categories)
+            df[col] = df[col].cat.set_categories(categorias)
+            novo[col] = novo[col].cat.set_categories(categorias)
+        df = pd.concat([df.drop(index=linha, errors="ignore"), novo])
+        return df if df.index.is_monotonic_increasing else df.sort_index()
+
+    conn = conectar_espelho()
+    with estado_espelho()["trava"]:
+        with conn:
+            antigo = ler_linha_espelho(tabela, colunas, linha)
+            conn.execute(f'DELETE FROM {tabela} WHERE "_linha" = ?', (linha,))
+            conn.execute(f"INSERT INTO {tabela} VALUES ({marcadores})", (linha, hash_registro(registro), *registro))
+        ajustar_resumo(tabela, colunas, antigo, registro)
+        corrigir_quadro_aba(tabela, alterar)
+
+
+def remover_linha_espelho(aba, linha):
+    tabela, colunas = estrutura_aba(aba)
+
+    def alterar(df):
+        df.drop(index=linha, inplace=True, errors="ignore")
+        indice = df.index.to_numpy().copy()
+        indice[indice > linha] -= 1
+        df.index = pd.Index(indice, name="_linha")
+        return df
+
+    conn = conectar_espelho()
+    with estado_espelho()["trava"]:
+        with conn:
+            antigo = ler_linha_espelho(tabela, colunas, linha)
+            conn.execute(f'DELETE FROM {tabela} WHERE "_linha" = ?', (linha,))
+            conn.execute(f'UPDATE {tabela} SET "_linha" = "_linha" - 1 WHERE "_linha" > ?', (linha,))
+        ajustar_resumo(tabela, colunas, antigo, None)
+        corrigir_quadro_aba(tabela, alterar)
+
+
+def ler_linha_espelho(tabela, colunas, linha):
+    selecao = ", ".join(f'"{col}"' for col in colunas)
+    return conectar_espelho().execute(f'SELECT {selecao} FROM {tabela} WHERE "_linha" = ?', (linha,)).fetchone()
+
+
+def calcular_resumo(tabela, df):
+    if tabela == "kanban":
+        return {"tarefas_abertas": int((df["Status"] != "Concluído").sum())}
+    idades = garantir_colunas_pacientes(df)["Idade"].fillna(0)
+    return {
+        "pacientes": len(df),
+        "idosos": int((idades >= 60).sum()),
+        "criancas": int(idades.between(0, 11).sum()),
+    }
+
+
+def resumo_registro(tabela, colunas, registro):
+    if registro is None:
+        return {}
+    return calcular_resumo(tabela, tipar_quadro(tabela, pd.DataFrame([list(registro)], columns=colunas)))
+
+
+def ajustar_resumo(tabela, colunas, antigo, novo):
+    estado = estado_espelho()
+    with estado["trava"]:
+        resumo = estado["resumos"].get(tabela)
+        if resumo is None or resumo["versao"] != estado["versoes"].get(tabela, 0):
+            return
+        antes = resumo_registro(tabela, colunas, antigo)
+        depois = resumo_registro(tabela, colunas, novo)
+        resumo["valores"] = {
+            chave: valor - antes.get(chave, 0) + depois.get(chave, 0) for chave, valor in resumo["valores"].items()
+        }
+        resumo["versao"] += 1
+
+
+def recalcular_resumo(aba):
+    tabela, _ = estrutura_aba(aba)
+    versao, quadro = carregar_quadro_aba(aba)
+    valores = calcular_resumo(tabela, quadro)
+    agora = time.time()
+    conn = conectar_espelho()
+    estado = estado_espelho()
+    with estado["trava"]:
+        estado["resumos"][tabela] = {"versao": versao, "calculado_em": agora, "valores": valores}
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO resumos (tabela, valores, calculado_em) VALUES (?, ?, ?)",
+                (tabela, json.dumps(valores), agora),
+            )
+    return valores
+
+
+def resumo_aba(aba):
+    tabela, _ = estrutura_aba(aba)
+    conn = conectar_espelho()
+    estado = estado_espelho()
+    chave = f"resumo_{tabela}"
+    with estado["trava"]:
+        resumo = estado["resumos"].get(tabela)
+        if resumo is None:
+            salvo = conn.execute("SELECT valores, calculado_em FROM resumos WHERE tabela = ?", (tabela,)).fetchone()
+            if salvo is not None:
+                resumo = {"versao": None, "calculado_em": salvo[1], "valores": json.loads(salvo[0])}
+                estado["resumos"][tabela] = resumo
+        atual = (
+            resumo is not None
+            and resumo["versao"] == estado["versoes"].get(tabela, 0)
+            and time.time() - resumo["calculado_em"] < INTERVALO_RESUMO
+        )
+        em_curso = atual or chave in estado["em_curso"]
+        if not em_curso:
+            estado["em_curso"].add(chave)
+
+    def executar():
+        try:
+            return recalcular_resumo(aba)
+        finally:
+            with estado["trava"]:
+                estado["em_curso"].discard(chave)
+
+    if resumo is None:
+        return recalcular_resumo(aba) if em_curso else executar()
+    if not em_curso:
+        threading.Thread(target=executar, daemon=True).start()
+    return dict(resumo["valores"])
+
+
+def consultar_linhas_espelho(tabela, ids):
+    marcadores = ", ".join("?" for _ in ids)
+    with estado_espelho()["trava"]:
+        resultado = conectar_espelho().execute(
+            f'SELECT "ID", MIN("_linha") FROM {tabela} WHERE "ID" IN ({marcadores}) GROUP BY "ID"',
+            ids,
+        ).fetchall()
+    return {registro_id: linha for registro_id, linha in resultado if linha is not None}
+
+
+def confirmar_linhas(aba, sugeridas):
+    confirmadas = {}
+    if sugeridas:
+        ids = aba.ler_ids(list(sugeridas.values()))
+        for (registro_id, linha), valor in zip(sugeridas.items(), ids):
+            if str(valor) == registro_id:
+                confirmadas[registro_id] = linha
+    return confirmadas
+
+
+def localizar_linhas(aba, ids, sugeridas=None):
+    tabela, _ = estrutura_aba(aba)
+    ids = list(dict.fromkeys(str(i) for i in ids))
+    sugeridas = dict(sugeridas or {})
+    sem_sugestao = [i for i in ids if i not in sugeridas]
+    if sem_sugestao:
+        sugeridas.update(consultar_linhas_espelho(tabela, sem_sugestao))
+    encontrados = confirmar_linhas(aba, {i: sugeridas[i] for i in ids if i in sugeridas})
+    if len(encontrados) < len(ids):
+        coluna_ids = aba.ler_ids()
+        posicoes = {}
+        for i, valor in enumerate(coluna_ids, start=1):
+            posicoes.setdefault(str(valor), i)
+        for registro_id in ids:
+            if registro_id not in encontrados and registro_id in posicoes:
+                encontrados[registro_id] = posicoes[registro_id]
+        invalidar_sincronizacao(tabela)
+    return encontrados
+
+
+def localizar_linha(aba, registro_id, linha_sugerida=None):
+    sugeridas = {str(registro_id): linha_sugerida} if linha_sugerida else None
+    return localizar_linhas(aba, [registro_id], sugeridas).get(str(registro_id))
+
+
+def ler_espelho(tabela, colunas):
+    selecao = ", ".join(f'"{col}"' for col in ["_linha"] + colunas)
+    return pd.read_sql_query(
+        f'SELECT {selecao} FROM {tabela} ORDER BY "_linha"',
+        conectar_espelho(),
+        index_col="_linha",
+    )
+
+
+def converter_datas(serie):
+    return pd.to_datetime(serie.astype(str).str.strip(), format="%d/%m/%Y", errors="coerce")
+
+
+def tipar_quadro(tabela, df):
+    for col in COLUNAS_CATEGORICAS[tabela]:
+        df[col] = df[col].astype(str).astype("category")
+    if tabela == "pacientes":
+        df["Idade"] = pd.to_numeric(df["Idade"], errors="coerce").round().astype("Int64")
+        df["_nascimento"] = converter_datas(df["Data de Nascimento"])
+        for col, destino in [("CPF", "_cpf"), ("CNS", "_cns")]:
+            df[destino] = df[col].astype(str).str.replace(r"\D", "", regex=True)
+        df["_telefone"] = padronizar_telefones(df["Telefone"])
+        df["_telefone_valido"] = df["_telefone"].str.len().between(10, 11)
+    else:
+        df["_prazo"] = converter_datas(df["Prazo"])
+    return df
+
+
+def colunas_visiveis(df):
+    return df[[col for col in df.columns if not str(col).startswith("_")]]
+
+
+def carregar_quadro_aba(aba):
+    tabela, colunas = estrutura_aba(aba)
+    agendar_sincronizacao(aba)
+    estado = estado_espelho()
+    with estado["trava"]:
+        versao = estado["versoes"].get(tabela, 0)
+        quadro = estado["quadros"].get(tabela)
+        if quadro is None or quadro[0] != versao:
+            quadro = (versao, tipar_quadro(tabela, ler_espelho(tabela, colunas)))
+            estado["quadros"][tabela] = quadro
+        return quadro[0], quadro[1].reset_index()
+
+
+def carregar_dados_aba(aba):
+    return carregar_quadro_aba(aba)[1]
+
+
+def normalizar_texto(texto):
+    texto = re.sub(r"(?<=\d)[.\-/](?=\d)", "", str(texto))
+    texto = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii").lower()
+    return re.sub(r"[^a-z0-9]+", " ", texto).strip()
+
+
+def normalizar_serie(serie):
+    return (
+        serie.astype(str)
+        .str.replace(r"(?<=\d)[.\-/](?=\d)", "", regex=True)
+        .str.normalize("NFKD")
+        .str.encode("ascii", "ignore")
+        .str.decode("ascii")
+        .str.lower()
+        .str.replace(r"[^a-z0-9]+", " ", regex=True)
+        .str.strip()
+    )
+
+
+def trigramas(token):
+    token = f" {token} "
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+def distancia_edicao(a, b, limite):
+    if abs(len(a) - len(b)) > limite:
+        return limite + 1
+    anterior, atual = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        antepenultima, anterior, atual = anterior, atual, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            custo = a[i - 1] != b[j - 1]
+            atual[j] = min(anterior[j] + 1, atual[j - 1] + 1, anterior[j - 1] + custo)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                atual[j] = min(atual[j], antepenultima[j - 2] + 1)
+        if min(atual) > limite:
+            return limite + 1
+    return atual[-1]
+
+
+def limite_edicao(termo):
+    return 1 if len(termo) <= 5 else 2
+
+
+class IndiceBusca:
+    def __init__(self, quadro, campos=CAMPOS_BUSCA):
+        self.quadro = quadro
+        self.campos = dict(campos)
+        self.postagens = {}
+        self.vocabulario = {}
+        self.trigramas = {}
+        self.posicoes = {}
+        self.numericos = {}
+        for campo in self.campos:
+            if campo in CAMPOS_BUSCA_NUMERICOS:
+                tokens = quadro[CAMPOS_BUSCA_NUMERICOS[campo]].astype(str)
+            else:
+                codigos, unicos = pd.factorize(quadro[campo].astype(str))
+                normalizados = normalizar_serie(pd.Series(unicos, dtype=object)).to_numpy(dtype=object)
+                tokens = pd.Series(normalizados[codigos], dtype=object).str.split().explode().dropna()
+            tokens = tokens[tokens != ""]
+            valores = tokens.to_numpy(dtype=object)
+            ordem = np.argsort(valores, kind="stable")
+            vocabulario, inicios, contagens = np.unique(valores[ordem], return_index=True, return_counts=True)
+            self.posicoes[campo] = tokens.index.to_numpy(dtype=np.int64)[ordem]
+            self.vocabulario[campo] = vocabulario.tolist()
+            self.postagens[campo] = dict(zip(self.vocabulario[campo], zip(inicios.tolist(), (inicios + contagens).tolist())))
+            if campo in CAMPOS_BUSCA_NUMERICOS:
+                self.numericos[campo] = vocabulario.astype(str)
+            if campo in CAMPOS_BUSCA_APROXIMADA:
+                grupos = {}
+                for token in self.vocabulario[campo]:
+                    for trigrama in trigramas(token):
+                        grupos.setdefault(trigrama, []).append(token)
+                self.trigramas[campo] = grupos
+
+    def linhas(self, campo, token):
+        inicio, fim = self.postagens[campo][token]
+        return self.posicoes[campo][inicio:fim]
+
+    def casar(self, campo, termo):
+        postagens = self.postagens[campo]
+        vocabulario = self.vocabulario[campo]
+        if termo in postagens:
+            yield self.linhas(campo, termo), 1.0
+        prefixos = []
+        i = bisect_left(vocabulario, termo)
+        while i < len(vocabulario) and vocabulario[i].startswith(termo):
+            if vocabulario[i] != termo:
+                prefixos.append(self.linhas(campo, vocabulario[i]))
+            i += 1
+        if prefixos:
+            yield np.concatenate(prefixos), PONTOS_PREFIXO
+        if campo in self.numericos and termo.isdigit():
+            trechos = np.flatnonzero(np.char.find(self.numericos[campo], termo) > 0)
+            if len(trechos):
+                yield np.concatenate([self.linhas(campo, vocabulario[i]) for i in trechos]), PONTOS_TRECHO_NUMERICO
+        if campo not in self.trigramas or len(termo) < 3 or not termo.isalpha():
+            return
+        trigramas_termo = trigramas(termo)
+        limite = limite_edicao(termo)
+        comuns = Counter(token for trigrama in trigramas_termo for token in self.trigramas[campo].get(trigrama, ()))
+        for token, quantidade in comuns.items():
+            if token.startswith(termo) or quantidade < len(trigramas_termo) - 4 * limite:
+                continue
+            distancia = distancia_edicao(termo, token, limite)
+            if distancia <= limite:
+                yield self.linhas(campo, token), PONTOS_APROXIMADO * (1 - distancia / max(len(termo), len(token)))
+
+    def buscar(self, termo, campos=None):
+        consulta = normalizar_texto(termo).split()
+        if not consulta:
+            return np.arange(len(self.quadro))
+        total = np.zeros(len(self.quadro))
+        encontrados = np.ones(len(self.quadro), dtype=bool)
+        for parte in consulta:
+            melhor = np.zeros(len(self.quadro))
+            for campo in campos or self.campos:
+                peso = self.campos[campo]
+                for posicoes, pontos in self.casar(campo, parte):
+                    melhor[posicoes] = np.maximum(melhor[posicoes], pontos * peso)
+            total += melhor
+            encontrados &= melhor > 0
+        posicoes = np.flatnonzero(encontrados)
+        return posicoes[np.argsort(-total[posicoes], kind="stable")]
+
+
+def base_indices(aba):
+    tabela, _ = estrutura_aba(aba)
+    agendar_sincronizacao(aba)
+    estado = estado_espelho()
+    with estado["trava"]:
+        base = estado["bases"].get(tabela)
+        if base is not None and base[0] == estado["versoes"].get(tabela, 0):
+            return base
+    versao, quadro = carregar_quadro_aba(aba)
+    base = (versao, garantir_colunas_pacientes(quadro))
+    with estado["trava"]:
+        estado["bases"][tabela] = base
+    return base
+
+
+def indice_por_versao(aba, nome, construir):
+    versao, quadro = base_indices(aba)
+    estado = estado_espelho()
+    with estado["trava"]:
+        indice = estado["indices"].get(nome)
+    if indice is None or indice[0] != versao:
+        indice = (versao, construir(quadro))
+        with estado["trava"]:
+            estado["indices"][nome] = indice
+    return indice[1]
+
+
+def indice_busca_pacientes(aba):
+    return indice_por_versao(aba, "busca", IndiceBusca)
+
+
+class IndicePacientes:
+    def __init__(self, quadro):
+        self.quadro = quadro
+        ids = quadro["ID"].astype(str)
+        primeiras = ~ids.duplicated().to_numpy()
+        unicos, ids = quadro[primeiras], ids[primeiras]
+        self.ids = dict(zip(ids, np.flatnonzero(primeiras).tolist()))
+        ordem = np.argsort(normalizar_serie(unicos["Nome Completo"]).to_numpy(dtype=object), kind="stable")
+        self.ordenados = ids.to_numpy(dtype=object)[ordem].tolist()
+        nascimentos = unicos["Data de Nascimento"].astype(str).str.strip().replace("", "sem data")
+        self.rotulos = dict(zip(ids, unicos["Nome Completo"].astype(str) + " · Nasc.: " + nascimentos + " · ID: " + ids))
+
+    def linha(self, registro_id):
+        posicao = self.ids.get(str(registro_id))
+        return None if posicao is None else self.quadro.iloc[posicao]
+
+    def paciente(self, registro_id):
+        linha = self.linha(registro_id)
+        return None if linha is None else linha.to_dict()
+
+    def rotulo(self, registro_id):
+        return self.rotulos.get(registro_id, str(registro_id))
+
+
+def indice_pacientes(aba):
+    return indice_por_versao(aba, "pacientes", IndicePacientes)
+
+
+def selecionar_paciente(indice, rotulo, ids=None, **kwargs):
+    return st.selectbox(rotulo, indice.ordenados if ids is None else ids, format_func=indice.rotulo, **kwargs)
+
+
+def fonetica_serie(serie):
+    nomes = normalizar_serie(serie).astype(object).str.replace(r"\b(da|de|do|das|dos|e)\b", " ", regex=True)
+    for padrao, troca in REGRAS_FONETICAS:
+        nomes = nomes.str.replace(padrao, troca, regex=True)
+    partes = nomes.str.split()
+    return (partes.str[0].fillna("") + " " + partes.str[-1].fillna("")).str.strip()
+
+
+def chaves_duplicata(quadro):
+    cpf = quadro["_cpf"].astype(str).astype(object)
+    cns = quadro["_cns"].astype(str).astype(object)
+    fonetica = fonetica_serie(quadro["Nome Completo"])
+    nascimento = quadro["_nascimento"].dt.strftime("%Y%m%d")
+    return {
+        "cpf": cpf.where((cpf.str.len() == 11) & ~cpf.str.fullmatch(r"(\d)\1+")),
+        "cns": cns.where((cns.str.len() == 15) & ~cns.str.fullmatch(r"(\d)\1+")),
+        "fonetica": (fonetica + "|" + nascimento).where((fonetica != "") & nascimento.notna()),
+    }
 
 
-@st.cache_data(ttl=60)
-def carregar_dados_aba(_aba):
-    dados = _aba.get_all_records()
-    return pd.DataFrame(dados)
+class MotorDuplicatas:
+    def __init__(self, quadro):
+        self.quadro = quadro
+        self.nomes = normalizar_serie(quadro["Nome Completo"]).to_numpy(dtype=object)
+        self.maes = normalizar_serie(quadro["Nome da Mãe"]).to_numpy(dtype=object)
+        self.nascimentos = quadro["_nascimento"].to_numpy()
+        self.cpfs = quadro["_cpf"].astype(str).to_numpy(dtype=object)
+        self.cns = quadro["_cns"].astype(str).to_numpy(dtype=object)
+        self.blocos = {}
+        for tipo, chaves in chaves_duplicata(quadro).items():
+            chaves = chaves.dropna()
+            rotulos = chaves.index.to_numpy()
+            self.blocos[tipo] = {chave: rotulos[posicoes] for chave, posicoes in chaves.groupby(chaves).indices.items()}
+        self.trigramas_nomes = {}
+        self.grupos_encontrados = None
+
+    def trigramas_nome(self, nome):
+        if nome not in self.trigramas_nomes:
+            self.trigramas_nomes[nome] = trigramas(nome.replace(" ", "_")) if nome else set()
+        return self.trigramas_nomes[nome]
+
+    def similaridade(self, a, b):
+        if not a or not b:
+            return 0.0
+        if a == b:
+            return 1.0
+        ta, tb = self.trigramas_nome(a), self.trigramas_nome(b)
+        return len(ta & tb) / len(ta | tb)
+
+    def pontuar(self, registro, j):
+        nome, mae, nascimento, cpf, cns = registro
+        pontos = PESOS_DUPLICATA["nome"] * self.similaridade(nome, self.nomes[j])
+        pontos += PESOS_DUPLICATA["mae"] * self.similaridade(mae, self.maes[j])
+        if not pd.isna(nascimento) and nascimento == self.nascimentos[j]:
+            pontos += PESOS_DUPLICATA["nascimento"]
+        if cpf and self.cpfs[j]:
+            pontos += PESOS_DUPLICATA["cpf"] if cpf == self.cpfs[j] else -PESOS_DUPLICATA["cpf"]
+        if cns and cns == self.cns[j]:
+            pontos += PESOS_DUPLICATA["cns"]
+        return min(pontos, 1.0)
+
+    def registro(self, i):
+        return self.nomes[i], self.maes[i], self.nascimentos[i], self.cpfs[i], self.cns[i]
+
+    def pares(self):
+        candidatos = set()
+        for blocos in self.blocos.values():
+            for posicoes in blocos.values():
+                if 1 < len(posicoes) <= TAMANHO_MAXIMO_BLOCO:
+                    candidatos.update(combinations(sorted(posicoes.tolist()), 2))
+        for i, j in candidatos:
+            pontos = self.pontuar(self.registro(i), j)
+            if pontos >= LIMIAR_DUPLICATA:
+                yield i, j, pontos
+
+    def grupos(self):
+        if self.grupos_encontrados is not None:
+            return self.grupos_encontrados
+        pais = {}
+        pontuacoes = {}
+
+        def raiz(i):
+            while pais.setdefault(i, i) != i:
+                pais[i] = pais[pais[i]]
+                i = pais[i]
+            return i
+
+        for i, j, pontos in self.pares():
+            ri, rj = raiz(i), raiz(j)
+            if ri != rj:
+                pais[rj] = ri
+                pontuacoes[ri] = max(pontuacoes.pop(ri, 0.0), pontuacoes.pop(rj, 0.0), pontos)
+            else:
+                pontuacoes[ri] = max(pontuacoes.get(ri, 0.0), pontos)
+        membros = {}
+        for i in pais:
+            membros.setdefault(raiz(i), []).append(i)
+        self.grupos_encontrados = sorted(
+            ((sorted(posicoes), pontuacoes[r]) for r, posicoes in membros.items()),
+            key=lambda grupo: (-grupo[1], -len(grupo[0])),
+        )
+        return self.grupos_encontrados
+
+    def candidatos(self, dados):
+        novo = pd.DataFrame([{col: dados.get(col, "") for col in ["Nome Completo", "Nome da Mãe", "Data de Nascimento", "CPF", "CNS"]}])
+        novo["_nascimento"] = converter_datas(novo["Data de Nascimento"])
+        novo["_cpf"] = novo["CPF"].astype(str).str.replace(r"\D", "", regex=True)
+        novo["_cns"] = novo["CNS"].astype(str).str.replace(r"\D", "", regex=True)
+        posicoes = set()
+        for tipo, chaves in chaves_duplicata(novo).items():
+            if pd.notna(chaves.iloc[0]):
+                posicoes.update(self.blocos[tipo].get(chaves.iloc[0], np.array([], dtype=np.int64)).tolist())
+        registro = (
+            normalizar_texto(novo["Nome Completo"].iloc[0]),
+            normalizar_texto(novo["Nome da Mãe"].iloc[0]),
+            novo["_nascimento"].to_numpy()[0],
+            novo["_cpf"].iloc[0],
+            novo["_cns"].iloc[0],
+        )
+        pontuados = [(j, self.pontuar(registro, j)) for j in posicoes]
+        return sorted(((j, p) for j, p in pontuados if p >= LIMIAR_DUPLICATA), key=lambda par: -par[1])
+
+
+def motor_duplicatas(aba):
+    return indice_por_versao(aba, "duplicatas", MotorDuplicatas)
+
+
+class PainelPacientes:
+    def __init__(self, quadro):
+        idades = quadro["Idade"].fillna(0)
+        limites = [inicio for inicio, _ in FAIXAS_ETARIAS.values()] + [np.inf]
+        faixas = pd.cut(idades, limites, right=False, labels=list(FAIXAS_ETARIAS))
+        self.total = len(quadro)
+        self.faixas = faixas.value_counts().reindex(list(FAIXAS_ETARIAS), fill_value=0)
+        self.sexo = quadro["Sexo"].astype(str).str.strip().str.upper().replace("", "NÃO INFORMADO").value_counts()
+        self.municipios = quadro["Município de Nascimento"].astype(str).value_counts()
+        self.registros = pd.to_datetime(quadro["Data de Registo"], format="%d/%m/%Y %H:%M:%S", errors="coerce")
+        self.registros_por_dia = self.registros.dt.normalize().value_counts().sort_index().rename("Cadastros")
+        self.quadro = quadro
+        self._grafico_sexo = None
+        self._ordens = {}
+
+    def ordem(self, coluna, crescente=True):
+        chave = (coluna, crescente)
+        if chave not in self._ordens:
+            if coluna == "Idade":
+                valores = self.quadro["Idade"]
+            elif coluna == "Data de Nascimento":
+                valores = self.quadro["_nascimento"]
+            elif coluna == "Data de Registo":
+                valores = self.registros
+            else:
+                valores = normalizar_serie(self.quadro[coluna]).replace("", None)
+            ordenados = valores.sort_values(ascending=crescente, kind="stable", na_position="last")
+            self._ordens[chave] = ordenados.index.to_numpy()
+        return self._ordens[chave]
+
+    def grafico_sexo(self):
+        if self._grafico_sexo is None:
+            import matplotlib.pyplot as plt
+
+            fig, ax = plt.subplots(figsize=(5, 3))
+            try:
+                self.sexo.plot.pie(ax=ax, autopct="%1.1f%%", startangle=90, ylabel="")
+                ax.axis("equal")
+                imagem = BytesIO()
+                fig.savefig(imagem, format="png", bbox_inches="tight")
+            finally:
+                plt.close(fig)
+            self._grafico_sexo = imagem.getvalue()
+        return self._grafico_sexo
+
+
+class IndiceFamilias:
+    def __init__(self, quadro):
+        self.quadro = quadro
+        familias = quadro["FAMÍLIA"].astype(str)
+        self.posicoes = {familia: posicoes for familia, posicoes in familias.groupby(familias).indices.items() if familia.strip()}
+        self.ordenadas = sorted(self.posicoes)
+        primeiros = [posicoes[0] for posicoes in self.posicoes.values()]
+        self.links = dict(zip(self.posicoes, quadro["Link da Pasta da Família"].astype(str).to_numpy()[primeiros]))
+        self.membros = {familia: len(posicoes) for familia, posicoes in self.posicoes.items()}
+        self._registros = None
+
+    def registros(self):
+        if self._registros is None:
+            self._registros = self.quadro[["Nome Completo", "Data de Nascimento", "CNS"]].astype(str).to_dict("records")
+        return self._registros
+
+    def membros_familia(self, familia):
+        registros = self.registros()
+        return [registros[posicao] for posicao in self.posicoes[familia]]
+
+    def para_etiquetas(self, familias):
+        return {familia: {"membros": self.membros_familia(familia), "link_pasta": self.links[familia]} for familia in familias}
+
+
+def indice_familias(aba):
+    return indice_por_versao(aba, "familias", IndiceFamilias)
+
+
+def painel_pacientes(aba):
+    return indice_por_versao(aba, "painel", PainelPacientes)
+
+
+class PacienteDuplicado(Exception):
+    def __init__(self, semelhantes):
+        super().__init__(f"Já existe(m) {len(semelhantes)} cadastro(s) parecido(s) com este paciente")
+        self.semelhantes = semelhantes
+
+
+def avisar_duplicata(erro):
+    st.warning(f"⚠️ {erro}. Se for outra pessoa, marque a opção para salvar mesmo assim.")
+    st.dataframe(
+        erro.semelhantes[["Semelhança", "ID", "Nome Completo", "Data de Nascimento", "Nome da Mãe", "CPF", "CNS", "FAMÍLIA"]],
+        use_container_width=True,
+        hide_index=True,
+    )
+
+
+def mesclar_pacientes(aba_pacientes, grupo, manter_id):
+    manter = grupo["ID"].astype(str).tolist().index(str(manter_id))
+    grupo = grupo.iloc[[manter] + [posicao for posicao in range(len(grupo)) if posicao != manter]]
+    dados = {}
+    for col in COLUNAS_PACIENTES:
+        valores = [str(valor) for valor in grupo[col] if not pd.isna(valor)]
+        dados[col] = next((valor for valor in valores if valor.strip()), "")
+    dados["ID"] = manter_id
+    chaves = [atualizar_paciente_por_id(aba_pacientes, manter_id, dados, int(grupo["_linha"].iloc[0]))]
+    excluir = sorted(zip(grupo["_linha"].iloc[1:].astype(int), grupo["ID"].iloc[1:]), reverse=True)
+    chaves.extend(excluir_paciente_por_id(aba_pacientes, registro_id, linha) for linha, registro_id in excluir)
+    return chaves
+
+
+class EscritaPendente:
+    def __init__(self, tipo, registro_id, dados, linha_prevista=None):
+        self.tipo = tipo
+        self.registro_id = str(registro_id)
+        self.dados = dict(dados)
+        self.linha_prevista = linha_prevista
+        self.estado = "pendente"
+        self.erro = None
+        self.linha = None
+
+    def finalizar(self, estado, linha=None, erro=None):
+        self.estado = estado
+        self.linha = linha
+        self.erro = erro
+
+
+class FilaEscrita:
+    def __init__(self, aba, lote_maximo=LOTE_MAXIMO_ESCRITA):
+        self.aba = aba
+        self.lote_maximo = lote_maximo
+        self.pendentes = []
+        self.trava = threading.Lock()
+
+    def enfileirar(self, escrita):
+        with self.trava:
+            self.pendentes.append(escrita)
+        return escrita
+
+    def anexar(self, dados):
+        return self.enfileirar(EscritaPendente("anexar", dados.get("ID", ""), dados))
+
+    def atualizar(self, registro_id, dados, linha_prevista=None):
+        return self.enfileirar(EscritaPendente("atualizar", registro_id, dados, linha_prevista))
+
+    def descarregar(self):
+        with self.trava:
+            lote, self.pendentes = self.pendentes, []
+        _, colunas = estrutura_aba(self.aba)
+        anexos = [e for e in lote if e.tipo == "anexar"]
+        atualizacoes = [e for e in lote if e.tipo == "atualizar"]
+
+        for inicio in range(0, len(anexos), self.lote_maximo):
+            parte = anexos[inicio:inicio + self.lote_maximo]
+            try:
+                primeira = self.aba.anexar_linhas([[e.dados.get(col, "") for col in colunas] for e in parte])
+                for deslocamento, escrita in enumerate(parte):
+                    linha = primeira + deslocamento if primeira else None
+                    escrita.finalizar("gravado", linha=linha)
+            except Exception as e:
+                for escrita in parte:
+                    escrita.finalizar("erro", erro=str(e))
+
+        if not atualizacoes:
+            return lote
+        try:
+            linhas = localizar_linhas(
+                self.aba,
+                [e.registro_id for e in atualizacoes],
+                {e.registro_id: e.linha_prevista for e in atualizacoes if e.linha_prevista},
+            )
+            validas = []
+            for escrita in atualizacoes:
+                if escrita.registro_id in linhas:
+                    validas.append(escrita)
+                else:
+                    escrita.finalizar("erro", erro="Registro não encontrado na planilha.")
+            if validas:
+                self.aba.atualizar_linhas({linhas[e.registro_id]: [e.dados.get(col, "") for col in colunas] for e in validas})
+            for escrita in validas:
+                escrita.finalizar("gravado", linha=linhas[escrita.registro_id])
+        except Exception as e:
+            for escrita in atualizacoes:
+                if escrita.estado == "pendente":
+                    escrita.finalizar("erro", erro=str(e))
+        return lote
+
+
+@st.cache_resource
+def fila_escrita(_aba, tabela):
+    return FilaEscrita(_aba)
+
+
+def fila_da_aba(aba):
+    tabela, _ = estrutura_aba(aba)
+    return fila_escrita(aba, tabela)
+
+
+def registrar_no_diario(aba, operacao, registro_id, dados=None, linha=None):
+    tabela, _ = estrutura_aba(aba)
+    registro_id = str(registro_id)
+    conn = conectar_espelho()
+    with estado_espelho()["trava"]:
+        if operacao == "anexar":
+            maxima = conn.execute(f'SELECT MAX("_linha") FROM {tabela}').fetchone()[0]
+            linha = (maxima or 1) + 1
+        elif linha is None:
+            linha = consultar_linhas_espelho(tabela, [registro_id]).get(registro_id)
+        chave = uuid.uuid4().hex
+        with conn:
+            conn.execute(
+                "INSERT INTO diario (chave, tabela, operacao, registro_id, dados, linha, criado_em) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (chave, tabela, operacao, registro_id, json.dumps(dados or {}, ensure_ascii=False, default=str), linha, time.time()),
+            )
+        if operacao == "excluir":
+            if linha is not None:
+                remover_linha_espelho(aba, linha)
+        elif linha is not None:
+            gravar_linha_espelho(aba, linha, dados)
+    estado_espelho()["sinal_diario"].set()
+    return chave
+
+
+def concluir_entrada_diario(entrada, linha):
+    conn = conectar_espelho()
+    with estado_espelho()["trava"], conn:
+        conn.execute(
+            "UPDATE diario SET estado = 'aplicado', linha = ?, erro = NULL, aplicado_em = ? WHERE seq = ?",
+            (linha, time.time(), entrada["seq"]),
+        )
+    if linha != entrada["linha"]:
+        invalidar_sincronizacao(entrada["tabela"])
+
+
+def falhar_entrada_diario(entrada, erro):
+    estado = "falhou" if entrada["tentativas"] + 1 >= TENTATIVAS_MAXIMAS_DIARIO else "pendente"
+    conn = conectar_espelho()
+    with estado_espelho()["trava"], conn:
+        conn.execute(
+            "UPDATE diario SET estado = ?, tentativas = tentativas + 1, erro = ? WHERE seq = ?",
+            (estado, str(erro), entrada["seq"]),
+        )
+
+
+def reproduzir_exclusao(aba, entrada):
+    linha = localizar_linha(aba, entrada["registro_id"], entrada["linha"])
+    if linha is not None:
+        aba.excluir_linha(linha)
+    concluir_entrada_diario(entrada, linha if linha is not None else entrada["linha"])
+
+
+def processar_diario(abas):
+    conn = conectar_espelho()
+    with estado_espelho()["trava"]:
+        conn.row_factory = sqlite3.Row
+        try:
+            entradas = [
+                dict(e)
+                for e in conn.execute(
+                    """
+                    SELECT * FROM diario AS d
+                    WHERE d.estado = 'pendente' AND NOT EXISTS (
+                        SELECT 1 FROM diario AS f
+                        WHERE f.estado = 'falhou' AND f.tabela = d.tabela AND f.registro_id = d.registro_id AND f.seq < d.seq
+                    )
+                    ORDER BY d.seq LIMIT ?
+                    """,
+                    (LOTE_MAXIMO_ESCRITA,),
+                )
+            ]
+        finally:
+            conn.row_factory = None
+    if not entradas:
+        return False
+
+    primeira = entradas[0]
+    aba = abas[primeira["tabela"]]
+    if primeira["operacao"] == "excluir":
+        try:
+            reproduzir_exclusao(aba, primeira)
+            return True
+        except Exception as e:
+            falhar_entrada_diario(primeira, e)
+            return False
+
+    sequencia = []
+    for entrada in entradas:
+        if entrada["tabela"] != primeira["tabela"] or entrada["operacao"] == "excluir":
+            break
+        sequencia.append(entrada)
+
+    ids_na_planilha = {}
+    if any(e["operacao"] == "anexar" and e["tentativas"] > 0 for e in sequencia):
+        try:
+            ids_na_planilha = {valor: i for i, valor in enumerate(aba.ler_ids(), start=1)}
+        except Exception as e:
+            for entrada in sequencia:
+                falhar_entrada_diario(entrada, e)
+            return False
+
+    fila = fila_da_aba(aba)
+    escritas = []
+    for entrada in sequencia:
+        dados = json.loads(entrada["dados"])
+        if entrada["operacao"] == "anexar":
+            if entrada["registro_id"] in ids_na_planilha:
+                concluir_entrada_diario(entrada, ids_na_planilha[entrada["registro_id"]])
+                continue
+            escritas.append((entrada, fila.anexar(dados)))
+        else:
+            escritas.append((entrada, fila.atualizar(entrada["registro_id"], dados, entrada["linha"])))
+    fila.descarregar()
+
+    sucesso = True
+    for entrada, escrita in escritas:
+        if escrita.estado == "gravado":
+            concluir_entrada_diario(entrada, escrita.linha)
+        else:
+            falhar_entrada_diario(entrada, escrita.erro)
+            sucesso = False
+    return sucesso
+
+
+def reenviar_falhas_diario():
+    conn = conectar_espelho()
+    with estado_espelho()["trava"], conn:
+        conn.execute("UPDATE diario SET estado = 'pendente', tentativas = 0 WHERE estado = 'falhou'")
+    estado_espelho()["sinal_diario"].set()
+
+
+def descartar_falhas_diario():
+    conn = conectar_espelho()
+    with estado_espelho()["trava"], conn:
+        falhas = conn.execute("SELECT DISTINCT tabela, registro_id FROM diario WHERE estado = 'falhou'").fetchall()
+        conn.executemany(
+            "UPDATE diario SET estado = 'descartado' WHERE tabela = ? AND registro_id = ? AND estado IN ('pendente', 'falhou')",
+            falhas,
+        )
+    for tabela in {tabela for tabela, _ in falhas}:
+        invalidar_sincronizacao(tabela)
+
+
+def reproduzir_diario(abas):
+    sinal = estado_espelho()["sinal_diario"]
+    while True:
+        sinal.wait(INTERVALO_REPRODUCAO)
+        sinal.clear()
+        time.sleep(JANELA_ESCRITA)
+        try:
+            while processar_diario(abas):
+                pass
+        except Exception:
+            pass
+
+
+@st.cache_resource
+def iniciar_reprodutor_diario(_abas, chave_armazenamento):
+    threading.Thread(target=reproduzir_diario, args=(_abas,), daemon=True).start()
+    return True
+
+
+def registrar_escrita(chave, descricao):
+    st.session_state.setdefault("escritas", []).append((descricao, chave))
+
+
+def mostrar_status_escritas():
+    conn = conectar_espelho()
+    with estado_espelho()["trava"]:
+        pendentes = conn.execute("SELECT COUNT(*) FROM diario WHERE estado = 'pendente'").fetchone()[0]
+        falhas = conn.execute("SELECT COUNT(*) FROM diario WHERE estado = 'falhou'").fetchone()[0]
+    if pendentes:
+        st.caption(f"📡 {pendentes} alteração(ões) salvas no aparelho aguardando envio à planilha.")
+    if falhas:
+        st.warning(
+            f"⚠️ {falhas} alteração(ões) não puderam ser enviadas à planilha. Elas continuam salvas no aparelho, "
+            "e as alterações seguintes dos mesmos registros aguardam até que sejam reenviadas ou descartadas."
+        )
+        c1, c2 = st.columns(2)
+        if c1.button("Reenviar", key="reenviar_falhas_diario"):
+            reenviar_falhas_diario()
+            st.rerun()
+        if c2.button("Descartar", key="descartar_falhas_diario"):
+            descartar_falhas_diario()
+            st.rerun()
+
+    escritas = st.session_state.get("escritas", [])
+    if not escritas:
+        return
+    chaves = [chave for _, chave in escritas]
+    with estado_espelho()["trava"]:
+        situacao = {
+            chave: (estado, erro)
+            for chave, estado, erro in conn.execute(
+                f"SELECT chave, estado, erro FROM diario WHERE chave IN ({', '.join('?' for _ in chaves)})",
+                chaves,
+            )
+        }
+    st.markdown("**Gravações recentes**")
+    restantes = []
+    for descricao, chave in escritas:
+        estado, erro = situacao.get(chave, ("aplicado", None))
+        if estado == "pendente":
+            st.caption(f"⏳ {descricao}: salvo no aparelho, aguardando envio" + (f" (nova tentativa: {erro})" if erro else ""))
+            restantes.append((descricao, chave))
+        elif estado == "aplicado":
+            st.caption(f"✅ {descricao}: gravado na planilha")
+        elif estado == "falhou":
+            st.caption(f"❌ {descricao}: não foi possível enviar ({erro}); mantido no aparelho")
+        else:
+            st.caption(f"🗑️ {descricao}: descartado")
+    st.session_state["escritas"] = restantes
+
+
+class ErroCotaSimulada(Exception):
+    codigo = 429
+
+
+class AbaFalsa:
+    def __init__(self, title, colunas, linhas=None, latencia=0.0, cota_por_minuto=None):
+        self.title = title
+        self.valores = [list(colunas)] + [[str(v) for v in linha] for linha in (linhas or [])]
+        self.latencia = latencia
+        self.cota_por_minuto = cota_por_minuto
+        self.chamadas = {}
+        self.chamadas_recentes = deque()
+        self.trava = threading.Lock()
+        self.trava_cota = threading.Lock()
+
+    def registrar(self, metodo):
+        with self.trava_cota:
+            agora = time.monotonic()
+            while self.chamadas_recentes and agora - self.chamadas_recentes[0] > 60:
+                self.chamadas_recentes.popleft()
+            if self.cota_por_minuto and len(self.chamadas_recentes) >= self.cota_por_minuto:
+                raise ErroCotaSimulada(f"Quota exceeded: {self.cota_por_minuto} requests per minute")
+            self.chamadas_recentes.append(agora)
+            self.chamadas[metodo] = self.chamadas.get(metodo, 0) + 1
+        if self.latencia:
+            time.sleep(self.latencia)
+
+    def intervalo(self, nome):
+        grade = utilitarios_planilha().a1_range_to_grid_range(nome.split("!")[-1])
+        return grade.get("startRowIndex", 0), grade.get("endRowIndex"), grade.get("startColumnIndex", 0), grade.get("endColumnIndex")
+
+    def escrever(self, nome, valores):
+        linha_inicial, _, coluna_inicial, _ = self.intervalo(nome)
+        for i, linha in enumerate(valores, start=linha_inicial):
+            while len(self.valores) <= i:
+                self.valores.append([])
+            destino = self.valores[i]
+            for j, valor in enumerate(linha, start=coluna_inicial):
+                while len(destino) <= j:
+                    destino.append("")
+                destino[j] = str(valor)
+
+    def get_all_values(self):
+        self.registrar("get_all_values")
+        with self.trava:
+            return [list(linha) for linha in self.valores]
+
+    def get_all_records(self):
+        self.registrar("get_all_records")
+        with self.trava:
+            cabecalho = self.valores[0]
+            return [dict(zip(cabecalho, linha + [""] * (len(cabecalho) - len(linha)))) for linha in self.valores[1:]]
+
+    def row_values(self, linha):
+        self.registrar("row_values")
+        with self.trava:
+            return list(self.valores[linha - 1]) if linha <= len(self.valores) else []
+
+    def col_values(self, coluna):
+        self.registrar("col_values")
+        with self.trava:
+            return [linha[coluna - 1] if coluna <= len(linha) else "" for linha in self.valores]
+
+    def cell(self, linha, coluna):
+        self.registrar("cell")
+        with self.trava:
+            valores = self.valores[linha - 1] if linha <= len(self.valores) else []
+            return SimpleNamespace(row=linha, col=coluna, value=valores[coluna - 1] if coluna <= len(valores) else "")
+
+    def batch_get(self, intervalos, **kwargs):
+        self.registrar("batch_get")
+        with self.trava:
+            resultado = []
+            for nome in intervalos:
+                li, lf, ci, cf = self.intervalo(nome)
+                resultado.append([linha[ci:cf] for linha in self.valores[li:lf]])
+            return resultado
+
+    def append_row(self, valores, **kwargs):
+        return self.append_rows([valores], **kwargs)
+
+    def append_rows(self, valores, **kwargs):
+        self.registrar("append_rows")
+        with self.trava:
+            primeira = len(self.valores) + 1
+            self.valores.extend([str(v) for v in linha] for linha in valores)
+            return {"updates": {"updatedRange": f"'{self.title}'!A{primeira}:{utilitarios_planilha().rowcol_to_a1(len(self.valores), len(self.valores[0]))}"}}
+
+    def update(self, nome, valores, **kwargs):
+        self.registrar("update")
+        with self.trava:
+            self.escrever(nome, valores)
+
+    def batch_update(self, dados, **kwargs):
+        self.registrar("batch_update")
+        with self.trava:
+            for item in dados:
+                self.escrever(item["range"], item["values"])
+
+    def delete_rows(self, inicio, fim=None):
+        self.registrar("delete_rows")
+        with self.trava:
+            del self.valores[inicio - 1:(fim or inicio)]
+
+
+def codigo_erro(erro):
+    codigo = getattr(getattr(erro, "response", None), "status_code", None)
+    if codigo is None:
+        codigo = getattr(erro, "codigo", None) or getattr(erro, "code", None)
+    try:
+        return int(codigo)
+    except (TypeError, ValueError):
+        return None
+
+
+class ControleCota:
+    def __init__(
+        self,
+        por_minuto=COTA_PLANILHA_POR_MINUTO,
+        tentativas=TENTATIVAS_COTA,
+        espera_base=ESPERA_BASE_COTA,
+        espera_maxima=ESPERA_MAXIMA_COTA,
+    ):
+        self.capacidade = por_minuto
+        self.reposicao = por_minuto / 60
+        self.fichas = float(por_minuto)
+        self.atualizado = time.monotonic()
+        self.tentativas = tentativas
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.trava = threading.Lock()
+        self.em_voo = {}
+        self.metricas = {}
+
+    def metrica(self, operacao):
+        if operacao not in self.metricas:
+            self.metricas[operacao] = {
+                "chamadas": 0,
+                "erros": 0,
+                "repetições": 0,
+                "coalescidas": 0,
+                "limitadas": 0,
+                "espera_cota": 0.0,
+                "latencias": deque(maxlen=AMOSTRAS_LATENCIA),
+            }
+        return self.metricas[operacao]
+
+    def reservar(self, operacao):
+        limitada = False
+        while True:
+            with self.trava:
+                agora = time.monotonic()
+                self.fichas = min(self.capacidade, self.fichas + (agora - self.atualizado) * self.reposicao)
+                self.atualizado = agora
+                if self.fichas >= 1:
+                    self.fichas -= 1
+                    return
+                espera = (1 - self.fichas) / self.reposicao
+                metrica = self.metrica(operacao)
+                metrica["espera_cota"] += espera
+                if not limitada:
+                    metrica["limitadas"] += 1
+                    limitada = True
+            time.sleep(espera)
+
+    def chamar(self, operacao, funcao, idempotente):
+        for tentativa in range(self.tentativas):
+            self.reservar(operacao)
+            inicio = time.perf_counter()
+            try:
+                resultado = funcao()
+            except Exception as erro:
+                codigo = codigo_erro(erro)
+                with self.trava:
+                    self.metrica(operacao)["erros"] += 1
+                    if codigo == 429:
+                        self.fichas = 0.0
+                repetir = codigo == 429 or (idempotente and codigo in CODIGOS_REPETICAO)
+                if not repetir or tentativa == self.tentativas - 1:
+                    raise
+                with self.trava:
+                    self.metrica(operacao)["repetições"] += 1
+                time.sleep(random.uniform(0, min(self.espera_maxima, self.espera_base * 2 ** tentativa)))
+                continue
+            with self.trava:
+                metrica = self.metrica(operacao)
+                metrica["chamadas"] += 1
+                metrica["latencias"].append(time.perf_counter() - inicio)
+            return resultado
+
+    def executar(self, operacao, funcao, chave=None, idempotente=True):
+        if chave is None:
+            return self.chamar(operacao, funcao, idempotente)
+        with self.trava:
+            voo = self.em_voo.get(chave)
+            dono = voo is None
+            if dono:
+                voo = self.em_voo[chave] = SimpleNamespace(evento=threading.Event(), resultado=None, erro=None)
+            else:
+                self.metrica(operacao)["coalescidas"] += 1
+        if not dono:
+            voo.evento.wait()
+            if voo.erro is not None:
+                raise voo.erro
+            return voo.resultado
+        try:
+            voo.resultado = self.chamar(operacao, funcao, idempotente)
+        except Exception as erro:
+            voo.erro = erro
+            raise
+        finally:
+            with self.trava:
+                del self.em_voo[chave]
+            voo.evento.set()
+        return voo.resultado
+
+    def resumo(self):
+        with self.trava:
+            linhas = []
+            for operacao, metrica in sorted(self.metricas.items()):
+                p50, p95, p99 = pd.Series(metrica["latencias"], dtype=float).mul(1000).quantile([0.5, 0.95, 0.99])
+                linhas.append({
+                    "Operação": operacao,
+                    "Chamadas": metrica["chamadas"],
+                    "Coalescidas": metrica["coalescidas"],
+                    "Erros": metrica["erros"],
+                    "Repetições": metrica["repetições"],
+                    "Limitadas pela cota": metrica["limitadas"],
+                    "Espera na cota (s)": round(metrica["espera_cota"], 1),
+                    "p50 (ms)": p50,
+                    "p95 (ms)": p95,
+                    "p99 (ms)": p99,
+                })
+            fichas = min(self.capacidade, self.fichas + (time.monotonic() - self.atualizado) * self.reposicao)
+        return pd.DataFrame(linhas), fichas
+
+
+@st.cache_resource
+def controle_cota():
+    return ControleCota()
+
+
+class ArmazenamentoPlanilha:
+    def __init__(self, aba, opcao_anexo="RAW", controle=None):
+        self.aba = aba
+        self.title = aba.title
+        self.opcao_anexo = opcao_anexo
+        self.controle = controle or controle_cota()
+
+    def ler_todos(self):
+        return self.controle.executar("get_all_values", self.aba.get_all_values, chave=(self.title, "get_all_values"))
+
+    def ler_ids(self, linhas=None):
+        if linhas is None:
+            return self.controle.executar("col_values", lambda: self.aba.col_values(1), chave=(self.title, "col_values"))
+        intervalos = [f"A{linha}" for linha in linhas]
+        celulas = self.controle.executar(
+            "batch_get", lambda: self.aba.batch_get(intervalos), chave=(self.title, "batch_get", tuple(intervalos))
+        )
+        return [str(valores[0][0]) if valores and valores[0] else "" for valores in celulas]
+
+    def anexar_linhas(self, linhas):
+        resposta = self.controle.executar(
+            "append_rows",
+            lambda: self.aba.append_rows(linhas, value_input_option=self.opcao_anexo),
+            idempotente=False,
+        )
+        return linha_do_intervalo(resposta)
+
+    def atualizar_linhas(self, linhas):
+        rowcol_to_a1 = utilitarios_planilha().rowcol_to_a1
+        self.controle.executar(
+            "batch_update",
+            lambda: self.aba.batch_update([
+                {"range": f"A{linha}:{rowcol_to_a1(linha, len(valores))}", "values": [valores]}
+                for linha, valores in linhas.items()
+            ]),
+        )
+
+    def excluir_linha(self, linha):
+        self.controle.executar("delete_rows", lambda: self.aba.delete_rows(linha), idempotente=False)
+
+
+class ArmazenamentoSQLite:
+    def __init__(self, caminho, title, colunas):
+        self.title = title
+        self.tabela = "aba_" + hashlib.sha1(title.encode("utf-8")).hexdigest()[:10]
+        self.conn = sqlite3.connect(caminho, check_same_thread=False)
+        self.trava = threading.Lock()
+        with self.trava, self.conn:
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {self.tabela} (linha INTEGER, id TEXT, valores TEXT)")
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.tabela}_linha ON {self.tabela} (linha)")
+            if not self.conn.execute(f"SELECT 1 FROM {self.tabela} WHERE linha = 1").fetchone():
+                self.conn.execute(f"INSERT INTO {self.tabela} VALUES (1, ?, ?)", (colunas[0], json.dumps(colunas, ensure_ascii=False)))
+
+    def ler_todos(self):
+        with self.trava:
+            linhas = self.conn.execute(f"SELECT valores FROM {self.tabela} ORDER BY linha").fetchall()
+        return [json.loads(valores) for (valores,) in linhas]
+
+    def ler_ids(self, linhas=None):
+        with self.trava:
+            if linhas is None:
+                return [registro_id for (registro_id,) in self.conn.execute(f"SELECT id FROM {self.tabela} ORDER BY linha")]
+            encontrados = dict(
+                self.conn.execute(
+                    f"SELECT linha, id FROM {self.tabela} WHERE linha IN ({', '.join('?' for _ in linhas)})",
+                    list(linhas),
+                )
+            )
+        return [encontrados.get(linha, "") for linha in linhas]
+
+    def anexar_linhas(self, linhas):
+        with self.trava, self.conn:
+            primeira = (self.conn.execute(f"SELECT MAX(linha) FROM {self.tabela}").fetchone()[0] or 0) + 1
+            self.conn.executemany(
+                f"INSERT INTO {self.tabela} VALUES (?, ?, ?)",
+                [
+                    (primeira + i, str(valores[0]) if valores else "", json.dumps([str(v) for v in valores], ensure_ascii=False))
+                    for i, valores in enumerate(linhas)
+                ],
+            )
+        return primeira
+
+    def atualizar_linhas(self, linhas):
+        with self.trava, self.conn:
+            self.conn.executemany(
+                f"UPDATE {self.tabela} SET id = ?, valores = ? WHERE linha = ?",
+                [
+                    (str(valores[0]) if valores else "", json.dumps([str(v) for v in valores], ensure_ascii=False), linha)
+                    for linha, valores in linhas.items()
+                ],
+            )
+
+    def excluir_linha(self, linha):
+        with self.trava, self.conn:
+            self.conn.execute(f"DELETE FROM {self.tabela} WHERE linha = ?", (linha,))
+            self.conn.execute(f"UPDATE {self.tabela} SET linha = linha - 1 WHERE linha > ?", (linha,))
+
+
+def pacientes_ficticios(quantidade, semente=42):
+    gerador = random.Random(semente)
+    nomes = ["Maria", "José", "Ana", "João", "Antônio", "Francisca", "Luiz", "Márcia", "Paulo", "Conceição"]
+    sobrenomes = ["Silva", "Santos", "Oliveira", "Souza", "Lima", "Pereira", "Ferreira", "Araújo", "Gomes", "Ribeiro"]
+    municipios = ["Saquarema", "Araruama", "Maricá", "Niterói", "Rio de Janeiro"]
+    hoje = date.today().toordinal()
+    linhas = []
+    for i in range(quantidade):
+        dados = {col: "" for col in COLUNAS_PACIENTES}
+        nascimento = date.fromordinal(hoje - gerador.randint(0, 365 * 95))
+        dados["ID"] = f"ID-F{i:07d}"
+        dados["FAMÍLIA"] = f"FAM{i // 4:05d}"
+        dados["Nome Completo"] = f"{gerador.choice(nomes)} {gerador.choice(sobrenomes)} {gerador.choice(sobrenomes)}"
+        dados["Data de Nascimento"] = nascimento.strftime("%d/%m/%Y") if gerador.random() > 0.05 else gerador.choice(["", "sem data"])
+        dados["Sexo"] = gerador.choice(["M", "F"])
+        dados["Nome da Mãe"] = f"{gerador.choice(nomes)} {gerador.choice(sobrenomes)}"
+        dados["Município de Nascimento"] = gerador.choice(municipios)
+        dados["Município de Residência"] = gerador.choice(municipios)
+        dados["CPF"] = "".join(gerador.choice("0123456789") for _ in range(11))
+        dados["CNS"] = "".join(gerador.choice("0123456789") for _ in range(15))
+        dados["Telefone"] = f"(22) 9{gerador.randint(1000, 9999)}-{gerador.randint(1000, 9999)}"
+        dados["Link da Pasta da Família"] = f"https://drive.google.com/drive/folders/FAM{i // 4:05d}"
+        dados["Data de Registo"] = date.fromordinal(hoje - gerador.randint(0, 365)).strftime("%d/%m/%Y 08:00:00")
+        linhas.append([dados[col] for col in COLUNAS_PACIENTES])
+    return linhas
+
+
+@st.cache_resource
+def armazenamentos_locais(tipo):
+    if tipo == "sqlite":
+        return (
+            ArmazenamentoSQLite(CAMINHO_ARMAZENAMENTO_SQLITE, "Página1", COLUNAS_PACIENTES),
+            ArmazenamentoSQLite(CAMINHO_ARMAZENAMENTO_SQLITE, "KANBAN", COLUNAS_KANBAN),
+        )
+    return (
+        ArmazenamentoPlanilha(
+            AbaFalsa("Página1", COLUNAS_PACIENTES, pacientes_ficticios(PACIENTES_FICTICIOS), LATENCIA_FALSA, COTA_FALSA_POR_MINUTO),
+            opcao_anexo="USER_ENTERED",
+        ),
+        ArmazenamentoPlanilha(AbaFalsa("KANBAN", COLUNAS_KANBAN, None, LATENCIA_FALSA, COTA_FALSA_POR_MINUTO)),
+    )
+
+
+def abrir_armazenamentos():
+    if TIPO_ARMAZENAMENTO in ("sqlite", "memoria"):
+        return armazenamentos_locais(TIPO_ARMAZENAMENTO)
+    planilha = conectar_planilha()
+    aba_pacientes, aba_kanban = obter_abas(planilha, planilha.id)
+    return ArmazenamentoPlanilha(aba_pacientes, opcao_anexo="USER_ENTERED"), ArmazenamentoPlanilha(aba_kanban)
 
 
 @st.cache_resource
@@ -453,6 +2062,8 @@ def cliente_gemini():
     if "GOOGLE_API_KEY" not in st.secrets:
         return None
     try:
+        import google.genai as genai
+
         return genai.Client(api_key=st.secrets["GOOGLE_API_KEY"])
     except Exception:
         return None
@@ -469,41 +2080,72 @@ def calcular_idade_por_data(data_str):
         return ""
 
 
-def padronizar_telefone(telefone):
-    if pd.isna(telefone) or telefone == "":
-        return None
-    num_limpo = re.sub(r"\D", "", str(telefone))
-    if num_limpo.startswith("55"):
-        num_limpo = num_limpo[2:]
-    if 10 <= len(num_limpo) <= 11:
-        return num_limpo
-    return None
+def calcular_idades(nascimentos, referencia=None):
+    hoje = pd.Timestamp(referencia or date.today())
+    anos = hoje.year - nascimentos.dt.year
+    aniversario_pendente = (nascimentos.dt.month > hoje.month) | (
+        (nascimentos.dt.month == hoje.month) & (nascimentos.dt.day > hoje.day)
+    )
+    return (anos - aniversario_pendente.astype(int)).astype("Int64")
 
 
-def buscar_dados_paciente(df, nome_paciente):
-    paciente_row = df[df["Nome Completo"] == nome_paciente]
-    if paciente_row.empty:
-        return None
-    return paciente_row.iloc[0].to_dict()
+def padronizar_telefones(telefones):
+    return telefones.astype(str).str.replace(r"\D", "", regex=True).str.replace(r"^55", "", regex=True)
+
+
+def buscar_dados_paciente(indice, registro_id):
+    return indice.paciente(registro_id)
+
+
+def valores_variavel(quadro, variavel):
+    coluna, padrao = VARIAVEIS_MENSAGEM[variavel]
+    valores = quadro.get(coluna, pd.Series(pd.NA, index=quadro.index)).astype("string").fillna("").str.strip()
+    if variavel == "NOME":
+        valores = valores.str.split().str[0].fillna("")
+    valores = valores.where(valores != "", padrao)
+    return valores + " anos" if variavel == "IDADE" else valores
+
+
+def compilar_modelo(mensagem):
+    partes = PADRAO_VARIAVEL.split(mensagem)
+    return [
+        (parte, True) if i % 2 and parte in VARIAVEIS_MENSAGEM else (f"[{parte}]" if i % 2 else parte, False)
+        for i, parte in enumerate(partes)
+        if parte
+    ]
+
+
+def renderizar_modelo(modelo, quadro):
+    mensagens = pd.Series("", index=quadro.index, dtype="string")
+    valores = {}
+    for texto, variavel in modelo:
+        if variavel and texto not in valores:
+            valores[texto] = valores_variavel(quadro, texto)
+        mensagens = mensagens + (valores[texto] if variavel else texto)
+    return mensagens
 
 
 def aplicar_substituicoes(mensagem, dados_paciente):
-    substituicoes = {
-        "[NOME]": dados_paciente.get("Nome Completo", "").split()[0] if dados_paciente.get("Nome Completo") else "",
-        "[NOME_COMPLETO]": dados_paciente.get("Nome Completo", "Não Informado"),
-        "[IDADE]": f"{dados_paciente.get('Idade', 'N/A')} anos",
-        "[CPF]": dados_paciente.get("CPF", "Não Informado"),
-        "[CNS]": dados_paciente.get("CNS", "Não Informado"),
-        "[DATA_NASCIMENTO]": dados_paciente.get("Data de Nascimento", "Não Informado"),
-        "[TELEFONE]": dados_paciente.get("Telefone", "Não Informado"),
-        "[CONDICOES]": dados_paciente.get("Condição", "Nenhuma registrada"),
-        "[MEDICAMENTOS]": dados_paciente.get("Medicamentos", "Nenhum registrado"),
-        "[FAMILIA]": dados_paciente.get("FAMÍLIA", "N/A"),
-        "[MUNICIPIO_NASC]": dados_paciente.get("Município de Nascimento", "N/A"),
-    }
-    for placeholder, valor in substituicoes.items():
-        mensagem = mensagem.replace(placeholder, str(valor))
-    return mensagem
+    return renderizar_modelo(compilar_modelo(mensagem), pd.DataFrame([dados_paciente])).iloc[0]
+
+
+def montar_campanha(pacientes, mensagem):
+    mensagens = renderizar_modelo(compilar_modelo(mensagem), pacientes)
+    links = "https://wa.me/55" + pacientes["_telefone"].astype("string") + "?text=" + mensagens.map(urllib.parse.quote)
+    return pd.DataFrame(
+        {
+            "ID": pacientes["ID"],
+            "Nome Completo": pacientes["Nome Completo"],
+            "Telefone": pacientes["_telefone"],
+            "Mensagem": mensagens,
+            "Link": links,
+        }
+    ).reset_index(drop=True)
+
+
+def campanha_html(campanha):
+    tabela = campanha.to_html(index=False, render_links=True, escape=True)
+    return f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>Campanha WhatsApp</title></head><body>{tabela}</body></html>'
 
 
 def parse_checklist(raw):
@@ -543,6 +2185,9 @@ def comentarios_para_json(items):
 def tarefa_atrasada(row):
     if str(row.get("Status", "")).strip() == "Concluído":
         return False
+    prazo = row.get("_prazo")
+    if prazo is not None:
+        return pd.notna(prazo) and prazo.date() < date.today()
     prazo = str(row.get("Prazo", "")).strip()
     if not prazo:
         return False
@@ -553,6 +2198,12 @@ def tarefa_atrasada(row):
         return False
 
 
+def tarefas_atrasadas(df):
+    if df.empty:
+        return pd.Series(False, index=df.index)
+    return (df["Status"].astype(str).str.strip() != "Concluído") & (df["_prazo"] < pd.Timestamp(date.today()))
+
+
 def progresso_checklist(raw):
     items = parse_checklist(raw)
     if not items:
@@ -598,46 +2249,38 @@ def garantir_colunas_pacientes(df):
     for col in COLUNAS_PACIENTES:
         if col not in df.columns:
             df[col] = ""
-    df["Idade"] = df.apply(
-        lambda row: row["Idade"] if str(row.get("Idade", "")).strip() != "" else calcular_idade_por_data(row.get("Data de Nascimento", "")),
-        axis=1,
-    )
+    if "_nascimento" not in df.columns:
+        df["_nascimento"] = converter_datas(df["Data de Nascimento"])
+    df["Idade"] = pd.to_numeric(df["Idade"], errors="coerce").round().astype("Int64")
+    df["Idade"] = df["Idade"].fillna(calcular_idades(df["_nascimento"]))
     return df
 
 
-def salvar_paciente(aba_pacientes, dados):
+def salvar_paciente(aba_pacientes, dados, permitir_duplicata=False):
+    if not permitir_duplicata:
+        motor = motor_duplicatas(aba_pacientes)
+        candidatos = motor.candidatos(dados)
+        if candidatos:
+            semelhantes = motor.quadro.iloc[[j for j, _ in candidatos]].copy()
+            semelhantes.insert(0, "Semelhança", [f"{pontos:.0%}" for _, pontos in candidatos])
+            raise PacienteDuplicado(semelhantes)
     agora = datetime.now()
     if not dados.get("ID"):
-        dados["ID"] = f"ID-{int(time.time())}"
+        dados["ID"] = f"ID-{int(time.time())}-{uuid.uuid4().hex[:6]}"
     dados["Timestamp de Envio"] = agora.strftime("%d/%m/%Y %H:%M:%S")
     dados["Data da Extração"] = agora.strftime("%d/%m/%Y")
     dados["Data de Registo"] = agora.strftime("%d/%m/%Y %H:%M:%S")
     dados["Idade"] = calcular_idade_por_data(dados.get("Data de Nascimento", ""))
-    linha = [dados.get(col, "") for col in COLUNAS_PACIENTES]
-    aba_pacientes.append_row(linha, value_input_option="USER_ENTERED")
-    st.cache_data.clear()
-
-
-def atualizar_paciente_por_id(aba_pacientes, patient_id, novos_dados):
-    dados = aba_pacientes.get_all_values()
-    linhas = dados[1:]
-    for i, linha in enumerate(linhas, start=2):
-        if str(linha[0]) == str(patient_id):
-            novos_dados["Idade"] = calcular_idade_por_data(novos_dados.get("Data de Nascimento", ""))
-            nova_linha = [novos_dados.get(col, "") for col in COLUNAS_PACIENTES]
-            aba_pacientes.update(f"A{i}:X{i}", [nova_linha])
-            st.cache_data.clear()
-            return
+    return registrar_no_diario(aba_pacientes, "anexar", dados["ID"], dados)
 
 
-def excluir_paciente_por_id(aba_pacientes, patient_id):
-    dados = aba_pacientes.get_all_values()
-    linhas = dados[1:]
-    for i, linha in enumerate(linhas, start=2):
-        if str(linha[0]) == str(patient_id):
-            aba_pacientes.delete_rows(i)
-            st.cache_data.clear()
-            return
+def atualizar_paciente_por_id(aba_pacientes, patient_id, novos_dados, linha=None):
+    novos_dados["Idade"] = calcular_idade_por_data(novos_dados.get("Data de Nascimento", ""))
+    return registrar_no_diario(aba_pacientes, "atualizar", patient_id, novos_dados, linha)
+
+
+def excluir_paciente_por_id(aba_pacientes, patient_id, linha=None):
+    return registrar_no_diario(aba_pacientes, "excluir", patient_id, linha=linha)
 
 
 def garantir_colunas_kanban(df):
@@ -648,36 +2291,23 @@ def garantir_colunas_kanban(df):
 
 
 def salvar_tarefa(aba_kanban, tarefa):
-    linha = [tarefa.get(col, "") for col in COLUNAS_KANBAN]
-    aba_kanban.append_row(linha)
-    st.cache_data.clear()
+    return registrar_no_diario(aba_kanban, "anexar", tarefa["ID"], tarefa)
 
 
 def atualizar_tarefa_por_id(aba_kanban, task_id, novos_dados):
-    dados = aba_kanban.get_all_values()
-    linhas = dados[1:]
-    for i, linha in enumerate(linhas, start=2):
-        if str(linha[0]) == str(task_id):
-            nova_linha = [novos_dados.get(col, "") for col in COLUNAS_KANBAN]
-            aba_kanban.update(f"A{i}:K{i}", [nova_linha])
-            st.cache_data.clear()
-            return
+    return registrar_no_diario(aba_kanban, "atualizar", task_id, novos_dados)
 
 
 def excluir_tarefa_por_id(aba_kanban, task_id):
-    dados = aba_kanban.get_all_values()
-    linhas = dados[1:]
-    for i, linha in enumerate(linhas, start=2):
-        if str(linha[0]) == str(task_id):
-            aba_kanban.delete_rows(i)
-            st.cache_data.clear()
-            return
+    return registrar_no_diario(aba_kanban, "excluir", task_id)
 
 
 def ocr_imagem_com_gemini(file_bytes, mime_type, client):
     if not client or not GENAI_OK:
         return None
     try:
+        from google.genai.types import Part
+
         image_part = Part.from_bytes(data=file_bytes, mime_type=mime_type)
         response = client.models.generate_content(
             model=MODELO_GEMINI,
@@ -704,9 +2334,9 @@ def extrair_dados_com_google_gemini(texto_extraido, client):
         response = client.models.generate_content(
             model=MODELO_GEMINI,
             contents=[prompt],
-            config={"response_mime_type": "application/json", "response_schema": CadastroSchema},
+            config={"response_mime_type": "application/json", "response_schema": esquemas_gemini().CadastroSchema},
         )
-        dados_pydantic = CadastroSchema.model_validate_json(response.text)
+        dados_pydantic = esquemas_gemini().CadastroSchema.model_validate_json(response.text)
         return dados_pydantic.model_dump(by_alias=True)
     except Exception as e:
         st.error(f"Erro ao extrair dados com Gemini: {e}")
@@ -729,9 +2359,9 @@ def extrair_dados_vacinacao_com_google_gemini(texto_extraido, client):
         response = client.models.generate_content(
             model=MODELO_GEMINI,
             contents=[prompt],
-            config={"response_mime_type": "application/json", "response_schema": VacinacaoSchema},
+            config={"response_mime_type": "application/json", "response_schema": esquemas_gemini().VacinacaoSchema},
         )
-        dados_pydantic = VacinacaoSchema.model_validate_json(response.text)
+        dados_pydantic = esquemas_gemini().VacinacaoSchema.model_validate_json(response.text)
         return dados_pydantic.model_dump()
     except Exception as e:
         st.error(f"Erro ao extrair vacinação com Gemini: {e}")
@@ -752,9 +2382,9 @@ def extrair_dados_clinicos_com_google_gemini(texto_prontuario, client):
         response = client.models.generate_content(
             model=MODELO_GEMINI,
             contents=[prompt],
-            config={"response_mime_type": "application/json", "response_schema": ClinicoSchema},
+            config={"response_mime_type": "application/json", "response_schema": esquemas_gemini().ClinicoSchema},
         )
-        dados_pydantic = ClinicoSchema.model_validate_json(response.text)
+        dados_pydantic = esquemas_gemini().ClinicoSchema.model_validate_json(response.text)
         return dados_pydantic.model_dump()
     except Exception as e:
         st.error(f"Erro ao extrair dados clínicos com Gemini: {e}")
@@ -774,9 +2404,9 @@ def gerar_dicas_com_google_gemini(tema, client):
         response = client.models.generate_content(
             model=MODELO_GEMINI,
             contents=[prompt],
-            config={"response_mime_type": "application/json", "response_schema": DicasSaudeSchema},
+            config={"response_mime_type": "application/json", "response_schema": esquemas_gemini().DicasSaudeSchema},
         )
-        dados_pydantic = DicasSaudeSchema.model_validate_json(response.text)
+        dados_pydantic = esquemas_gemini().DicasSaudeSchema.model_validate_json(response.text)
         return dados_pydantic.model_dump()
     except Exception as e:
         st.error(f"Erro ao gerar dicas com Gemini: {e}")
@@ -791,6 +2421,9 @@ def ler_texto_prontuario_gemini(file_bytes, client):
         return None
 
     try:
+        from google.genai.types import Part
+        from pdf2image import convert_from_bytes
+
         imagens_pil = convert_from_bytes(file_bytes)
         texto_completo = ""
         progress_bar = st.progress(0, text="Processando páginas do PDF...")
@@ -840,37 +2473,165 @@ def analisar_carteira_vacinacao(data_nascimento_str, vacinas_administradas):
     return relatorio
 
 
-def preencher_pdf_formulario(paciente_dados):
-    template_pdf_path = "Formulario_2IndiceDeVulnerabilidadeClinicoFuncional20IVCF20_ImpressoraPDFPreenchivel_202404-2.pdf"
-    try:
-        packet = BytesIO()
-        can = canvas.Canvas(packet, pagesize=A4)
+@st.cache_resource(show_spinner=False)
+def modelo_ivcf():
+    with open(CAMINHO_MODELO_IVCF, "rb") as arquivo:
+        return arquivo.read()
+
+
+def sobreposicoes_ivcf(pacientes):
+    from pypdf import PdfReader
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.pdfgen import canvas
+
+    packet = BytesIO()
+    can = canvas.Canvas(packet, pagesize=A4)
+    for paciente_dados in pacientes:
         can.setFont("Helvetica", 10)
         can.drawString(3.2 * cm, 23.8 * cm, str(paciente_dados.get("Nome Completo", "")))
         can.drawString(15 * cm, 23.8 * cm, str(paciente_dados.get("CPF", "")))
         can.drawString(16.5 * cm, 23 * cm, str(paciente_dados.get("Data de Nascimento", "")))
-        can.save()
-
-        packet.seek(0)
-        new_pdf = PdfReader(packet)
-        existing_pdf = PdfReader(open(template_pdf_path, "rb"))
-        output = PdfWriter()
-        page = existing_pdf.pages[0]
-        page.merge_page(new_pdf.pages[0])
-        output.add_page(page)
+        can.showPage()
+    can.save()
+    packet.seek(0)
+    return PdfReader(packet).pages
+
+
+def formulario_ivcf(modelo, sobreposicao):
+    from pypdf import PdfWriter
+
+    output = PdfWriter()
+    page = output.add_page(modelo)
+    page.merge_page(sobreposicao)
+    final_buffer = BytesIO()
+    output.write(final_buffer)
+    final_buffer.seek(0)
+    return final_buffer
+
+
+def registrar_objeto_pdf(output, objeto):
+    # O pypdf não tem API pública para registrar um objeto indireto avulso; rever ao atualizar o pypdf.
+    return output._add_object(objeto)
+
+
+def formularios_ivcf_mesclados(modelo, sobreposicoes):
+    from pypdf import PdfWriter
+    from pypdf.generic import ArrayObject, DecodedStreamObject, DictionaryObject, NameObject
+
+    output = PdfWriter()
+    formulario = DecodedStreamObject()
+    formulario.set_data(modelo.get_contents().get_data())
+    formulario.update(
+        {
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Form"),
+            NameObject("/BBox"): ArrayObject(modelo.mediabox),
+            NameObject("/Resources"): modelo["/Resources"].clone(output),
+        }
+    )
+    referencia = registrar_objeto_pdf(output, formulario.flate_encode())
+    prefixo = DecodedStreamObject()
+    prefixo.set_data(b"q /ModeloIVCF Do Q\n")
+    referencia_prefixo = registrar_objeto_pdf(output, prefixo)
+
+    for sobreposicao in sobreposicoes:
+        page = output.add_page(sobreposicao)
+        recursos = page["/Resources"].get_object()
+        xobjetos = recursos.setdefault(NameObject("/XObject"), DictionaryObject()).get_object()
+        xobjetos[NameObject("/ModeloIVCF")] = referencia
+        page[NameObject("/Contents")] = ArrayObject([referencia_prefixo, page.raw_get("/Contents")])
+
+    final_buffer = BytesIO()
+    output.write(final_buffer)
+    final_buffer.seek(0)
+    return final_buffer
+
+
+def preencher_pdf_formulario(paciente_dados):
+    from pypdf import PdfReader
+
+    try:
+        modelo = PdfReader(BytesIO(modelo_ivcf())).pages[0]
+        return formulario_ivcf(modelo, sobreposicoes_ivcf([paciente_dados])[0])
+    except FileNotFoundError:
+        st.warning("Arquivo modelo do formulário não encontrado no repositório.")
+        return None
+    except Exception as e:
+        st.error(f"Erro ao gerar PDF do formulário: {e}")
+        return None
+
+
+def preencher_formularios_em_lote(pacientes, compactar=False):
+    from pypdf import PdfReader
+
+    try:
+        modelo = PdfReader(BytesIO(modelo_ivcf())).pages[0]
+        sobreposicoes = sobreposicoes_ivcf(pacientes)
+        if not compactar:
+            return formularios_ivcf_mesclados(modelo, sobreposicoes)
         final_buffer = BytesIO()
-        output.write(final_buffer)
+        with zipfile.ZipFile(final_buffer, "w", zipfile.ZIP_DEFLATED) as arquivo_zip:
+            for paciente_dados, sobreposicao in zip(pacientes, sobreposicoes):
+                nome = re.sub(r"\W+", "_", str(paciente_dados.get("Nome Completo", ""))).strip("_")
+                arquivo_zip.writestr(
+                    f"formulario_{nome}_{paciente_dados.get('ID', '')}.pdf",
+                    formulario_ivcf(modelo, sobreposicao).getvalue(),
+                )
         final_buffer.seek(0)
         return final_buffer
     except FileNotFoundError:
         st.warning("Arquivo modelo do formulário não encontrado no repositório.")
         return None
     except Exception as e:
-        st.error(f"Erro ao gerar PDF do formulário: {e}")
+        st.error(f"Erro ao gerar PDFs dos formulários: {e}")
         return None
 
 
+@lru_cache(maxsize=TAMANHO_CACHE_QRCODE)
+def modulos_qrcode(conteudo):
+    import qrcode
+
+    qr = qrcode.QRCode(version=1, border=2)
+    qr.add_data(conteudo)
+    qr.make(fit=True)
+    matriz = qr.get_matrix()
+    trechos = []
+    for linha, modulos in enumerate(matriz):
+        coluna = 0
+        while coluna < len(modulos):
+            if modulos[coluna]:
+                inicio = coluna
+                while coluna < len(modulos) and modulos[coluna]:
+                    coluna += 1
+                trechos.append((linha, inicio, coluna - inicio))
+            else:
+                coluna += 1
+    return len(matriz), tuple(trechos)
+
+
+def desenhar_qrcode(can, conteudo, x, y, lado):
+    tamanho, trechos = modulos_qrcode(conteudo)
+    nome = "qr" + hashlib.sha1(conteudo.encode("utf-8")).hexdigest()
+    if not can.hasForm(nome):
+        can.beginForm(nome, 0, 0, tamanho, tamanho)
+        caminho = can.beginPath()
+        for linha, coluna, comprimento in trechos:
+            caminho.rect(coluna, tamanho - linha - 1, comprimento, 1)
+        can.drawPath(caminho, stroke=0, fill=1)
+        can.endForm()
+    can.saveState()
+    can.translate(x, y)
+    can.scale(lado / tamanho, lado / tamanho)
+    can.doForm(nome)
+    can.restoreState()
+
+
 def gerar_pdf_etiquetas(familias_para_gerar):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.pdfgen import canvas
+
     pdf_buffer = BytesIO()
     can = canvas.Canvas(pdf_buffer, pagesize=A4)
     largura_pagina, altura_pagina = A4
@@ -892,14 +2653,7 @@ def gerar_pdf_etiquetas(familias_para_gerar):
 
         link_pasta = dados_familia.get("link_pasta", "")
         if link_pasta:
-            qr = qrcode.QRCode(version=1, box_size=8, border=2)
-            qr.add_data(link_pasta)
-            qr.make(fit=True)
-            img_qr = qr.make_image(fill_color="black", back_color="white")
-            qr_buffer = BytesIO()
-            img_qr.save(qr_buffer, format="PNG")
-            qr_buffer.seek(0)
-            can.drawImage(ImageReader(qr_buffer), x_base + 0.5 * cm, y_base + 0.5 * cm, width=2.5 * cm, height=2.5 * cm)
+            desenhar_qrcode(can, link_pasta, x_base + 0.5 * cm, y_base + 0.5 * cm, 2.5 * cm)
 
         x_texto = x_base + 3.5 * cm
         y_texto = y_base + altura_etiqueta - 0.8 * cm
@@ -933,6 +2687,11 @@ def gerar_pdf_etiquetas(familias_para_gerar):
 
 
 def gerar_pdf_capas_prontuario(pacientes_df):
+    from reportlab.lib.colors import HexColor
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.pdfgen import canvas
+
     pdf_buffer = BytesIO()
     can = canvas.Canvas(pdf_buffer, pagesize=A4)
     largura_pagina, altura_pagina = A4
@@ -943,83 +2702,87 @@ def gerar_pdf_capas_prontuario(pacientes_df):
     COR_ALERTA = HexColor("#e74c3c")
     COR_FUNDO_ALERTA = HexColor("#fde6e4")
 
-    for _, paciente in pacientes_df.iterrows():
-        can.setFont("Helvetica", 9)
-        can.setFillColor(COR_SECUNDARIA)
-        can.drawRightString(largura_pagina - 2 * cm, altura_pagina - 2 * cm, "Sistema de Gestão")
+    margem_caixa = 2 * cm
+    largura_caixa = largura_pagina - (2 * margem_caixa)
+    altura_caixa = 5.5 * cm
+    x_caixa, y_caixa = margem_caixa, altura_pagina - 10.5 * cm
+    altura_cabecalho_interno = 1.5 * cm
+    y_cabecalho_interno = y_caixa + altura_caixa - altura_cabecalho_interno
+    y_texto_nome = y_cabecalho_interno + (altura_cabecalho_interno / 2) - (0.2 * cm)
+
+    y_inicio_dados = y_cabecalho_interno - 1.2 * cm
+    x_label_esq, x_valor_esq = x_caixa + 1 * cm, x_caixa + 4.5 * cm
+    x_label_dir, x_valor_dir = x_caixa + (largura_caixa / 2) + 1 * cm, x_caixa + (largura_caixa / 2) + 4 * cm
+    pares_dados = [
+        ("Data de Nasc.", "Data de Nascimento", "Família", "FAMÍLIA"),
+        ("CPF", "CPF", "CNS", "CNS"),
+        ("Telefone", "Telefone", "Sexo", "Sexo"),
+    ]
 
-        can.setFont("Helvetica-Bold", 18)
-        can.setFillColor(COR_PRINCIPAL)
-        can.drawCentredString(largura_pagina / 2, altura_pagina - 4 * cm, "PRONTUÁRIO CLÍNICO INDIVIDUAL")
+    x_alerta, y_alerta = 2 * cm, altura_pagina - 17 * cm
+    largura_alerta = largura_pagina - 4 * cm
+    altura_alerta = 2.5 * cm
+    y_texto_alerta = y_alerta + altura_alerta - 1.5 * cm
+
+    can.beginForm("capa_prontuario")
+    can.setFont("Helvetica", 9)
+    can.setFillColor(COR_SECUNDARIA)
+    can.drawRightString(largura_pagina - 2 * cm, altura_pagina - 2 * cm, "Sistema de Gestão")
 
-        margem_caixa = 2 * cm
-        largura_caixa = largura_pagina - (2 * margem_caixa)
-        altura_caixa = 5.5 * cm
-        x_caixa, y_caixa = margem_caixa, altura_pagina - 10.5 * cm
+    can.setFont("Helvetica-Bold", 18)
+    can.setFillColor(COR_PRINCIPAL)
+    can.drawCentredString(largura_pagina / 2, altura_pagina - 4 * cm, "PRONTUÁRIO CLÍNICO INDIVIDUAL")
 
-        altura_cabecalho_interno = 1.5 * cm
-        y_cabecalho_interno = y_caixa + altura_caixa - altura_cabecalho_interno
-        can.setFillColor(COR_FUNDO_CABECALHO)
-        can.rect(x_caixa, y_cabecalho_interno, largura_caixa, altura_cabecalho_interno, stroke=0, fill=1)
+    can.setFillColor(COR_FUNDO_CABECALHO)
+    can.rect(x_caixa, y_cabecalho_interno, largura_caixa, altura_cabecalho_interno, stroke=0, fill=1)
+    can.setStrokeColor(COR_PRINCIPAL)
+    can.setLineWidth(1.5)
+    can.rect(x_caixa, y_caixa, largura_caixa, altura_caixa, stroke=1, fill=0)
 
-        can.setStrokeColor(COR_PRINCIPAL)
-        can.setLineWidth(1.5)
-        can.rect(x_caixa, y_caixa, largura_caixa, altura_caixa, stroke=1, fill=0)
+    can.setFont("Helvetica", 10)
+    can.setFillColor(COR_SECUNDARIA)
+    for i, (label_esq, _, label_dir, _) in enumerate(pares_dados):
+        can.drawString(x_label_esq, y_inicio_dados - i * 0.8 * cm, f"{label_esq}:")
+        can.drawString(x_label_dir, y_inicio_dados - i * 0.8 * cm, f"{label_dir}:")
+
+    can.setFillColor(COR_FUNDO_ALERTA)
+    can.setStrokeColor(COR_ALERTA)
+    can.setLineWidth(0.5)
+    can.rect(x_alerta, y_alerta, largura_alerta, altura_alerta, fill=1, stroke=1)
+    can.setFont("Helvetica-Bold", 12)
+    can.setFillColor(COR_ALERTA)
+    can.drawString(x_alerta + 0.5 * cm, y_alerta + altura_alerta - 0.6 * cm, "ALERTA CLÍNICO RÁPIDO")
+
+    can.setFont("Helvetica-Bold", 10)
+    can.setFillColor(COR_PRINCIPAL)
+    can.drawString(2 * cm, 5 * cm, "Observações Clínicas:")
+    can.setStrokeColor(COR_SECUNDARIA)
+    can.setLineWidth(0.5)
+    y_linha = 4.5 * cm
+    for _ in range(4):
+        can.line(2 * cm, y_linha, largura_pagina - 2 * cm, y_linha)
+        y_linha -= 0.6 * cm
+    can.endForm()
+
+    for paciente in pacientes_df.to_dict("records"):
+        can.doForm("capa_prontuario")
+        can.setFillColor(COR_PRINCIPAL)
 
         nome_paciente = str(paciente.get("Nome Completo", "NOME INDISPONÍVEL")).upper()
-        y_texto_nome = y_cabecalho_interno + (altura_cabecalho_interno / 2) - (0.2 * cm)
         can.setFont("Helvetica-Bold", 15)
-        can.setFillColor(COR_PRINCIPAL)
         can.drawCentredString(largura_pagina / 2, y_texto_nome, nome_paciente)
 
-        def draw_data_pair(y, label_esq, val_esq, label_dir, val_dir):
-            x_label_esq, x_valor_esq = x_caixa + 1 * cm, x_caixa + 4.5 * cm
-            x_label_dir, x_valor_dir = x_caixa + (largura_caixa / 2) + 1 * cm, x_caixa + (largura_caixa / 2) + 4 * cm
-            can.setFont("Helvetica", 10)
-            can.setFillColor(COR_SECUNDARIA)
-            can.drawString(x_label_esq, y, f"{label_esq}:")
-            can.drawString(x_label_dir, y, f"{label_dir}:")
-            can.setFont("Helvetica-Bold", 11)
-            can.setFillColor(COR_PRINCIPAL)
-            can.drawString(x_valor_esq, y, str(val_esq))
-            can.drawString(x_valor_dir, y, str(val_dir))
-
-        y_inicio_dados = y_cabecalho_interno - 1.2 * cm
-        draw_data_pair(y_inicio_dados, "Data de Nasc.", paciente.get("Data de Nascimento", "N/A"), "Família", paciente.get("FAMÍLIA", "N/A"))
-        draw_data_pair(y_inicio_dados - 0.8 * cm, "CPF", paciente.get("CPF", "N/A"), "CNS", paciente.get("CNS", "N/A"))
-        draw_data_pair(y_inicio_dados - 1.6 * cm, "Telefone", paciente.get("Telefone", "N/A"), "Sexo", paciente.get("Sexo", "N/A"))
+        can.setFont("Helvetica-Bold", 11)
+        for i, (_, coluna_esq, _, coluna_dir) in enumerate(pares_dados):
+            can.drawString(x_valor_esq, y_inicio_dados - i * 0.8 * cm, str(paciente.get(coluna_esq, "N/A")))
+            can.drawString(x_valor_dir, y_inicio_dados - i * 0.8 * cm, str(paciente.get(coluna_dir, "N/A")))
 
         condicoes = str(paciente.get("Condição", "Nenhuma registrada")).strip()
         medicamentos = str(paciente.get("Medicamentos", "Nenhum registrado")).strip()
-
-        x_alerta, y_alerta = 2 * cm, altura_pagina - 17 * cm
-        largura_alerta = largura_pagina - 4 * cm
-        altura_alerta = 2.5 * cm
-
-        can.setFillColor(COR_FUNDO_ALERTA)
-        can.setStrokeColor(COR_ALERTA)
-        can.setLineWidth(0.5)
-        can.rect(x_alerta, y_alerta, largura_alerta, altura_alerta, fill=1, stroke=1)
-
-        can.setFont("Helvetica-Bold", 12)
-        can.setFillColor(COR_ALERTA)
-        can.drawString(x_alerta + 0.5 * cm, y_alerta + altura_alerta - 0.6 * cm, "ALERTA CLÍNICO RÁPIDO")
-
         can.setFont("Helvetica", 9)
-        can.setFillColor(COR_PRINCIPAL)
-        y_texto_alerta = y_alerta + altura_alerta - 1.5 * cm
         can.drawString(x_alerta + 0.5 * cm, y_texto_alerta, f"Condições: {condicoes}")
         can.drawString(x_alerta + 0.5 * cm, y_texto_alerta - 0.5 * cm, f"Medicamentos: {medicamentos}")
 
-        can.setFont("Helvetica-Bold", 10)
-        can.drawString(2 * cm, 5 * cm, "Observações Clínicas:")
-        can.setStrokeColor(COR_SECUNDARIA)
-        can.setLineWidth(0.5)
-        y_linha = 4.5 * cm
-        for _ in range(4):
-            can.line(2 * cm, y_linha, largura_pagina - 2 * cm, y_linha)
-            y_linha -= 0.6 * cm
-
         can.showPage()
 
     can.save()
@@ -1027,7 +2790,58 @@ def gerar_pdf_capas_prontuario(pacientes_df):
     return pdf_buffer
 
 
+def funcao_importavel(funcao):
+    if funcao.__module__ != "__main__":
+        return funcao
+    return getattr(import_module(os.path.splitext(os.path.basename(__file__))[0]), funcao.__name__)
+
+
+def ler_arquivo(arquivo):
+    arquivo.seek(0)
+    return arquivo.read()
+
+
+def gerar_lote_capas(registros):
+    return gerar_pdf_capas_prontuario(pd.DataFrame(registros)).getvalue()
+
+
+def capas_por_lote(lotes, processos):
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    if processos <= 1:
+        yield from map(gerar_lote_capas, lotes)
+        return
+    gerar = funcao_importavel(gerar_lote_capas)
+    with ProcessPoolExecutor(processos, mp_context=multiprocessing.get_context("spawn")) as pool:
+        em_curso = deque()
+        for lote in lotes:
+            em_curso.append(pool.submit(gerar, lote))
+            if len(em_curso) >= 2 * processos:
+                yield em_curso.popleft().result()
+        while em_curso:
+            yield em_curso.popleft().result()
+
+
+def gerar_pdf_capas_em_lotes(pacientes_df, processos=None):
+    capas = pacientes_df[COLUNAS_CAPA].astype(str)
+    inicios = range(0, len(capas), TAMANHO_LOTE_CAPAS)
+    lotes = (capas.iloc[inicio:inicio + TAMANHO_LOTE_CAPAS].to_dict("records") for inicio in inicios)
+    processos = min(processos or os.cpu_count() or 1, len(inicios))
+    destino = tempfile.SpooledTemporaryFile(max_size=LIMITE_MEMORIA_CAPAS)
+    with zipfile.ZipFile(destino, "w", zipfile.ZIP_DEFLATED) as arquivo_zip:
+        for numero, pdf in enumerate(capas_por_lote(lotes, processos), start=1):
+            arquivo_zip.writestr(f"capas_prontuario_{numero:03d}.pdf", pdf)
+    destino.seek(0)
+    return destino
+
+
 def gerar_pdf_relatorio_vacinacao(nome_paciente, data_nascimento, relatorio):
+    from reportlab.lib.colors import HexColor
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.pdfgen import canvas
+
     pdf_buffer = BytesIO()
     can = canvas.Canvas(pdf_buffer, pagesize=A4)
     largura_pagina, altura_pagina = A4
@@ -1086,23 +2900,18 @@ def gerar_pdf_relatorio_vacinacao(nome_paciente, data_nascimento, relatorio):
 def pagina_menu(aba_pacientes, aba_kanban):
     hero("Coleta Rápida", "Sistema inteligente de cadastro, gestão de pacientes e rotinas de campo.")
 
-    df = garantir_colunas_pacientes(carregar_dados_aba(aba_pacientes))
-    df_kanban = garantir_colunas_kanban(carregar_dados_aba(aba_kanban))
-
-    total = len(df)
-    idosos = len(df[pd.to_numeric(df["Idade"], errors="coerce").fillna(0) >= 60]) if not df.empty else 0
-    criancas = len(df[pd.to_numeric(df["Idade"], errors="coerce").fillna(0).between(0, 11)]) if not df.empty else 0
-    tarefas_abertas = len(df_kanban[df_kanban["Status"].astype(str) != "Concluído"]) if not df_kanban.empty else 0
+    resumo_pacientes = resumo_aba(aba_pacientes)
+    resumo_kanban = resumo_aba(aba_kanban)
 
     m1, m2, m3, m4 = st.columns(4)
     with m1:
-        metric_card("Pacientes", total)
+        metric_card("Pacientes", resumo_pacientes["pacientes"])
     with m2:
-        metric_card("Idosos", idosos)
+        metric_card("Idosos", resumo_pacientes["idosos"])
     with m3:
-        metric_card("Crianças", criancas)
+        metric_card("Crianças", resumo_pacientes["criancas"])
     with m4:
-        metric_card("Tarefas abertas", tarefas_abertas)
+        metric_card("Tarefas abertas", resumo_kanban["tarefas_abertas"])
 
     st.markdown("---")
 
@@ -1234,6 +3043,8 @@ def pagina_coletar_fichas(aba_pacientes, gemini_client):
     if not uploaded_file:
         return
 
+    from PIL import Image
+
     st.image(Image.open(uploaded_file), width=380)
 
     if st.button("Extrair texto da imagem"):
@@ -1268,6 +3079,7 @@ def pagina_coletar_fichas(aba_pacientes, gemini_client):
             telefone = st.text_input("Telefone", value=dados_extraidos.get("Telefone", ""))
             observacoes = st.text_area("Observações", value="")
             condicao = st.text_input("Condição", value="")
+        ignorar_duplicata = st.checkbox("Salvar mesmo se já houver cadastro parecido")
         salvar = st.form_submit_button("Salvar paciente")
 
         if salvar:
@@ -1285,10 +3097,14 @@ def pagina_coletar_fichas(aba_pacientes, gemini_client):
             dados["Observações"] = observacoes
             dados["Condição"] = condicao
             dados["Fonte da Imagem"] = uploaded_file.name
-            salvar_paciente(aba_pacientes, dados)
-            st.success("Paciente salvo com sucesso.")
-            st.session_state.pop("texto_ficha", None)
-            st.rerun()
+            try:
+                registrar_escrita(salvar_paciente(aba_pacientes, dados, ignorar_duplicata), f"Paciente {nome}")
+            except PacienteDuplicado as erro:
+                avisar_duplicata(erro)
+            else:
+                st.success("Paciente salvo.")
+                st.session_state.pop("texto_ficha", None)
+                st.rerun()
 
 
 def pagina_cadastro_pacientes(aba_pacientes):
@@ -1315,6 +3131,7 @@ def pagina_cadastro_pacientes(aba_pacientes):
             medicamentos = st.text_input("Medicamentos")
             obs = st.text_area("Observações")
 
+        ignorar_duplicata = st.checkbox("Salvar mesmo se já houver cadastro parecido")
         enviar = st.form_submit_button("Salvar paciente")
 
         if enviar:
@@ -1338,132 +3155,231 @@ def pagina_cadastro_pacientes(aba_pacientes):
                 dados["Status_Vacinal"] = status_vacinal.strip()
                 dados["Medicamentos"] = medicamentos.strip()
                 dados["Observações"] = obs.strip()
-                salvar_paciente(aba_pacientes, dados)
-                st.success("Paciente salvo com sucesso.")
-                st.rerun()
+                try:
+                    registrar_escrita(salvar_paciente(aba_pacientes, dados, ignorar_duplicata), f"Paciente {nome.strip()}")
+                except PacienteDuplicado as erro:
+                    avisar_duplicata(erro)
+                else:
+                    st.success("Paciente salvo.")
+                    st.rerun()
 
 
 def pagina_gestao_pacientes(aba_pacientes):
     botao_voltar_menu()
     hero("Gestão de Pacientes", "Pesquise, edite e exclua registros.")
-    df = garantir_colunas_pacientes(carregar_dados_aba(aba_pacientes))
+    indice = indice_busca_pacientes(aba_pacientes)
+    df = indice.quadro
     if df.empty:
         st.warning("Ainda não há pacientes cadastrados.")
         return
 
-    coluna = st.selectbox("Pesquisar por:", ["Nome Completo", "CPF", "CNS", "FAMÍLIA", "Nome da Mãe"])
-    termo = st.text_input("Digite o termo de pesquisa")
-    resultados = df[df[coluna].astype(str).str.contains(termo, case=False, na=False)] if termo else df.copy()
+    coluna = st.selectbox("Pesquisar por:", ["Todos os campos"] + list(CAMPOS_BUSCA))
+    termo = st.text_input(
+        "Digite o termo de pesquisa",
+        placeholder="Nome, mãe, família, CPF ou CNS (acentos e pequenos erros de digitação são tolerados)",
+    )
+    resultados = df.iloc[indice.buscar(termo, None if coluna == "Todos os campos" else [coluna])]
 
     st.markdown(f"**{len(resultados)}** resultado(s) encontrado(s).")
+    if resultados.empty:
+        return
 
-    for _, row in resultados.iterrows():
-        patient_id = row["ID"]
-        with st.expander(f"**{row['Nome Completo']}** (ID: {patient_id})"):
-            st.dataframe(row.to_frame().T, use_container_width=True, hide_index=True)
-
-            with st.form(f"edit_patient_{patient_id}"):
-                novos_dados = row.to_dict()
-                c1, c2 = st.columns(2)
-                with c1:
-                    novos_dados["FAMÍLIA"] = st.text_input("FAMÍLIA", value=row.get("FAMÍLIA", ""))
-                    novos_dados["Nome Completo"] = st.text_input("Nome Completo", value=row.get("Nome Completo", ""))
-                    novos_dados["Data de Nascimento"] = st.text_input("Data de Nascimento", value=row.get("Data de Nascimento", ""))
-                    novos_dados["Sexo"] = st.text_input("Sexo", value=row.get("Sexo", ""))
-                    novos_dados["Nome da Mãe"] = st.text_input("Nome da Mãe", value=row.get("Nome da Mãe", ""))
-                    novos_dados["Nome do Pai"] = st.text_input("Nome do Pai", value=row.get("Nome do Pai", ""))
-                with c2:
-                    novos_dados["Município de Nascimento"] = st.text_input("Município de Nascimento", value=row.get("Município de Nascimento", ""))
-                    novos_dados["Município de Residência"] = st.text_input("Município de Residência", value=row.get("Município de Residência", ""))
-                    novos_dados["CPF"] = st.text_input("CPF", value=row.get("CPF", ""))
-                    novos_dados["CNS"] = st.text_input("CNS", value=row.get("CNS", ""))
-                    novos_dados["Telefone"] = st.text_input("Telefone", value=row.get("Telefone", ""))
-                    novos_dados["Condição"] = st.text_input("Condição", value=row.get("Condição", ""))
-                novos_dados["Observações"] = st.text_area("Observações", value=row.get("Observações", ""))
-
-                b1, b2 = st.columns(2)
-                salvar = b1.form_submit_button("Salvar alterações")
-                excluir = b2.form_submit_button("Excluir paciente")
-
-                if salvar:
-                    atualizar_paciente_por_id(aba_pacientes, patient_id, novos_dados)
-                    st.success("Paciente atualizado.")
-                    st.rerun()
+    c1, c2 = st.columns(2)
+    tamanho = c1.selectbox("Resultados por página", TAMANHOS_PAGINA_GESTAO, index=1)
+    total_paginas = max(1, -(-len(resultados) // tamanho))
+    pagina = c2.number_input(
+        f"Página (de {total_paginas})",
+        min_value=1,
+        max_value=total_paginas,
+        value=1,
+        step=1,
+        key=f"gestao_pagina_{coluna}_{termo}_{tamanho}",
+    )
 
-                if excluir:
-                    excluir_paciente_por_id(aba_pacientes, patient_id)
-                    st.success("Paciente excluído.")
-                    st.rerun()
+    painel = st.container()
+    for _, row in resultados.iloc[(pagina - 1) * tamanho:pagina * tamanho].iterrows():
+        c1, c2 = st.columns([6, 1])
+        c1.markdown(
+            f"**{row['Nome Completo']}** · Nasc.: {row['Data de Nascimento'] or 'N/A'} · "
+            f"Família: {row['FAMÍLIA'] or 'N/A'} (ID: {row['ID']})"
+        )
+        if c2.button("Abrir", key=f"abrir_paciente_{row['ID']}", use_container_width=True):
+            st.session_state["gestao_paciente_aberto"] = row["ID"]
+
+    patient_id = st.session_state.get("gestao_paciente_aberto")
+    if not patient_id:
+        return
+    row = indice_pacientes(aba_pacientes).linha(patient_id)
+    if row is None:
+        st.session_state.pop("gestao_paciente_aberto", None)
+        return
+
+    with painel:
+        st.subheader(f"{row['Nome Completo']} (ID: {patient_id})")
+        if st.button("Fechar", key="fechar_paciente"):
+            st.session_state.pop("gestao_paciente_aberto", None)
+            st.rerun()
+        st.dataframe(colunas_visiveis(row.to_frame().T), use_container_width=True, hide_index=True)
+
+        with st.form(f"edit_patient_{patient_id}"):
+            novos_dados = row.to_dict()
+            c1, c2 = st.columns(2)
+            with c1:
+                novos_dados["FAMÍLIA"] = st.text_input("FAMÍLIA", value=row.get("FAMÍLIA", ""))
+                novos_dados["Nome Completo"] = st.text_input("Nome Completo", value=row.get("Nome Completo", ""))
+                novos_dados["Data de Nascimento"] = st.text_input("Data de Nascimento", value=row.get("Data de Nascimento", ""))
+                novos_dados["Sexo"] = st.text_input("Sexo", value=row.get("Sexo", ""))
+                novos_dados["Nome da Mãe"] = st.text_input("Nome da Mãe", value=row.get("Nome da Mãe", ""))
+                novos_dados["Nome do Pai"] = st.text_input("Nome do Pai", value=row.get("Nome do Pai", ""))
+            with c2:
+                novos_dados["Município de Nascimento"] = st.text_input("Município de Nascimento", value=row.get("Município de Nascimento", ""))
+                novos_dados["Município de Residência"] = st.text_input("Município de Residência", value=row.get("Município de Residência", ""))
+                novos_dados["CPF"] = st.text_input("CPF", value=row.get("CPF", ""))
+                novos_dados["CNS"] = st.text_input("CNS", value=row.get("CNS", ""))
+                novos_dados["Telefone"] = st.text_input("Telefone", value=row.get("Telefone", ""))
+                novos_dados["Condição"] = st.text_input("Condição", value=row.get("Condição", ""))
+            novos_dados["Observações"] = st.text_area("Observações", value=row.get("Observações", ""))
+
+            b1, b2 = st.columns(2)
+            salvar = b1.form_submit_button("Salvar alterações")
+            excluir = b2.form_submit_button("Excluir paciente")
+
+            if salvar:
+                registrar_escrita(
+                    atualizar_paciente_por_id(aba_pacientes, patient_id, novos_dados),
+                    f"Paciente {novos_dados['Nome Completo']}",
+                )
+                st.success("Paciente atualizado.")
+                st.rerun()
+
+            if excluir:
+                registrar_escrita(excluir_paciente_por_id(aba_pacientes, patient_id), f"Exclusão de {row['Nome Completo']}")
+                st.session_state.pop("gestao_paciente_aberto", None)
+                st.success("Paciente excluído.")
+                st.rerun()
+
+
+def pagina_duplicidades(aba_pacientes):
+    botao_voltar_menu()
+    hero("Cadastros Duplicados", "Revise e mescle pacientes cadastrados mais de uma vez.")
+    motor = motor_duplicatas(aba_pacientes)
+    grupos = motor.grupos()
+    if not grupos:
+        st.success("Nenhum cadastro duplicado encontrado.")
+        return
+
+    st.markdown(f"**{len(grupos)}** grupo(s) de possíveis duplicatas, dos mais prováveis para os menos prováveis.")
+    total_paginas = -(-len(grupos) // GRUPOS_POR_PAGINA)
+    pagina = st.number_input(f"Página (de {total_paginas})", min_value=1, max_value=total_paginas, value=1, step=1)
+
+    for posicoes, pontos in grupos[(pagina - 1) * GRUPOS_POR_PAGINA:pagina * GRUPOS_POR_PAGINA]:
+        grupo = motor.quadro.iloc[posicoes]
+        ids = grupo["ID"].tolist()
+        with st.expander(f"**{grupo['Nome Completo'].iloc[0]}** e mais {len(grupo) - 1} cadastro(s) · semelhança {pontos:.0%}"):
+            st.dataframe(colunas_visiveis(grupo), use_container_width=True, hide_index=True)
+            manter = st.selectbox(
+                "Cadastro a manter (campos vazios serão preenchidos com os dos demais)",
+                ids,
+                format_func=lambda registro_id: f"{registro_id} · {grupo.loc[grupo['ID'] == registro_id, 'Data de Registo'].iloc[0]}",
+                key=f"manter_{ids[0]}",
+            )
+            if st.button("Mesclar cadastros", key=f"mesclar_{ids[0]}"):
+                for chave in mesclar_pacientes(aba_pacientes, grupo, manter):
+                    registrar_escrita(chave, f"Mesclagem de {grupo['Nome Completo'].iloc[0]}")
+                st.success("Cadastros mesclados.")
+                st.rerun()
 
 
 def pagina_dashboard_pacientes(aba_pacientes):
     botao_voltar_menu()
     hero("Dashboard de Pacientes", "Indicadores gerais da base cadastrada.")
-    df = garantir_colunas_pacientes(carregar_dados_aba(aba_pacientes))
-    if df.empty:
+    painel = painel_pacientes(aba_pacientes)
+    if not painel.total:
         st.warning("Ainda não há pacientes cadastrados.")
         return
 
-    df["Idade"] = pd.to_numeric(df["Idade"], errors="coerce").fillna(0)
-    total = len(df)
-    idosos = len(df[df["Idade"] >= 60])
-    criancas = len(df[df["Idade"].between(0, 11)])
-    adolescentes = len(df[df["Idade"].between(12, 17)])
-
     m1, m2, m3, m4 = st.columns(4)
     with m1:
-        metric_card("Total", total)
+        metric_card("Total", painel.total)
     with m2:
-        metric_card("Idosos", idosos)
+        metric_card("Idosos", int(painel.faixas["Idosos"]))
     with m3:
-        metric_card("Crianças", criancas)
+        metric_card("Crianças", int(painel.faixas["Crianças"]))
     with m4:
-        metric_card("Adolescentes", adolescentes)
+        metric_card("Adolescentes", int(painel.faixas["Adolescentes"]))
 
     st.markdown("---")
     c1, c2 = st.columns(2)
 
     with c1:
         st.subheader("Pacientes por Município")
-        if "Município de Nascimento" in df.columns:
-            st.bar_chart(df["Município de Nascimento"].astype(str).value_counts())
+        st.bar_chart(painel.municipios)
 
     with c2:
         st.subheader("Distribuição por Sexo")
-        sexo_counts = df["Sexo"].astype(str).str.upper().value_counts()
-        if not sexo_counts.empty:
-            fig, ax = plt.subplots(figsize=(5, 3))
-            sexo_counts.plot.pie(ax=ax, autopct="%1.1f%%", startangle=90)
-            ax.axis("equal")
-            st.pyplot(fig)
+        if not painel.sexo.empty:
+            st.image(painel.grafico_sexo())
+
+    c3, c4 = st.columns(2)
+    with c3:
+        st.subheader("Pacientes por Faixa Etária")
+        st.bar_chart(painel.faixas)
+    with c4:
+        st.subheader("Cadastros por Dia")
+        if not painel.registros_por_dia.empty:
+            st.line_chart(painel.registros_por_dia)
 
     st.markdown("---")
-    st.dataframe(df, use_container_width=True)
+    st.subheader("Pacientes")
+    visiveis = list(colunas_visiveis(painel.quadro).columns)
+    colunas = st.multiselect("Colunas exibidas", visiveis, default=COLUNAS_TABELA_PAINEL)
+    c1, c2, c3, c4 = st.columns(4)
+    ordenar = c1.selectbox("Ordenar por", visiveis, index=visiveis.index("Nome Completo"))
+    crescente = c2.selectbox("Ordem", ["Crescente", "Decrescente"]) == "Crescente"
+    tamanho = c3.selectbox("Linhas por página", TAMANHOS_PAGINA_PAINEL, index=1)
+    total_paginas = max(1, -(-painel.total // tamanho))
+    pagina = c4.number_input(
+        f"Página (de {total_paginas})",
+        min_value=1,
+        max_value=total_paginas,
+        value=1,
+        step=1,
+        key=f"painel_pagina_{ordenar}_{crescente}_{tamanho}",
+    )
+    inicio = (pagina - 1) * tamanho
+    posicoes = painel.ordem(ordenar, crescente)[inicio:inicio + tamanho]
+    visiveis = painel.quadro.iloc[posicoes][colunas or [ordenar]]
+    st.dataframe(
+        visiveis.apply(lambda col: col.cat.remove_unused_categories() if col.dtype == "category" else col),
+        use_container_width=True,
+        hide_index=True,
+    )
+    st.caption(f"Pacientes {inicio + 1}–{inicio + len(posicoes)} de {painel.total}.")
 
 
 def pagina_whatsapp(aba_pacientes):
     botao_voltar_menu()
-    hero("WhatsApp Manual", "Gere mensagens personalizadas para pacientes.")
-    df = garantir_colunas_pacientes(carregar_dados_aba(aba_pacientes))
+    hero("WhatsApp Manual", "Gere mensagens personalizadas para um paciente ou para uma campanha.")
+    indice = indice_pacientes(aba_pacientes)
+    df = indice.quadro
     if df.empty:
         st.warning("Ainda não há pacientes cadastrados.")
         return
 
-    df_com_telefone = df[df["Telefone"].astype(str).str.strip() != ""].copy()
-    df_com_telefone["Telefone Limpo"] = df_com_telefone["Telefone"].apply(padronizar_telefone)
-    df_com_telefone = df_com_telefone.dropna(subset=["Telefone Limpo"])
+    df_com_telefone = df[df["_telefone_valido"]]
 
     if df_com_telefone.empty:
         st.warning("Não há pacientes com telefone válido.")
         return
 
-    lista_pacientes = sorted(df_com_telefone["Nome Completo"].tolist())
+    lista_pacientes = df_com_telefone.sort_values("Nome Completo")["ID"].astype(str).tolist()
 
+    campanha = st.toggle("Campanha (vários pacientes)")
     c1, c2 = st.columns(2)
     with c1:
         tipo = st.selectbox("Tipo de mensagem", ["Exames", "Marcação Médica", "Orientações Gerais", "Personalizada"])
     with c2:
-        paciente_nome = st.selectbox("Paciente", lista_pacientes)
+        paciente_id = None if campanha else selecionar_paciente(indice, "Paciente", lista_pacientes)
 
     templates = {
         "Exames": "Olá, [NOME]! Seu exame [TIPO_EXAME] está agendado para [DATA_HORA]. Dúvidas? Ligue 2641-1499.",
@@ -1490,49 +3406,85 @@ def pagina_whatsapp(aba_pacientes):
 
     mensagem_editada = st.text_area("Mensagem final", mensagem_base, height=150)
 
-    if paciente_nome:
-        dados_paciente = buscar_dados_paciente(df_com_telefone, paciente_nome)
+    if campanha:
+        secao_campanha_whatsapp(df_com_telefone, mensagem_editada)
+    elif paciente_id:
+        dados_paciente = buscar_dados_paciente(indice, paciente_id)
         if dados_paciente:
             mensagem_final = aplicar_substituicoes(mensagem_editada, dados_paciente)
-            telefone_limpo = dados_paciente["Telefone Limpo"]
-            whatsapp_url = f"https://wa.me/55{telefone_limpo}?text={urllib.parse.quote(mensagem_final)}"
+            whatsapp_url = f"https://wa.me/55{dados_paciente['_telefone']}?text={urllib.parse.quote(mensagem_final)}"
             st.code(mensagem_final, language="text")
             st.link_button("Abrir WhatsApp", whatsapp_url)
 
 
+def secao_campanha_whatsapp(pacientes, mensagem):
+    st.subheader("Pacientes da campanha")
+    c1, c2, c3 = st.columns(3)
+    idade_min, idade_max = c1.slider("Faixa etária", 0, 120, (0, 120))
+    condicao = c2.text_input("Condição contém", placeholder="Ex.: hipertensão")
+    familias = c3.multiselect("Famílias", sorted(f for f in pacientes["FAMÍLIA"].astype(str).unique() if f.strip()))
+
+    selecao = pd.Series(True, index=pacientes.index)
+    if (idade_min, idade_max) != (0, 120):
+        selecao &= pacientes["Idade"].between(idade_min, idade_max).fillna(False).astype(bool)
+    if condicao.strip():
+        selecao &= normalizar_serie(pacientes["Condição"]).str.contains(normalizar_texto(condicao), regex=False)
+    if familias:
+        selecao &= pacientes["FAMÍLIA"].astype(str).isin(familias)
+
+    selecionados = pacientes[selecao].sort_values("Nome Completo")
+    st.markdown(f"**{len(selecionados)}** paciente(s) com telefone válido selecionado(s).")
+    if selecionados.empty:
+        return
+
+    lista = montar_campanha(selecionados, mensagem)
+    st.dataframe(lista.head(20), use_container_width=True, hide_index=True, column_config={"Link": st.column_config.LinkColumn()})
+    if len(lista) > 20:
+        st.caption(f"Mostrando 20 de {len(lista)} mensagens; baixe a lista completa abaixo.")
+    sufixo = datetime.now().strftime("%Y%m%d_%H%M")
+    c1, c2 = st.columns(2)
+    c1.download_button(
+        "Baixar lista (CSV)",
+        data=lista.to_csv(index=False).encode("utf-8-sig"),
+        file_name=f"campanha_whatsapp_{sufixo}.csv",
+        mime="text/csv",
+    )
+    c2.download_button(
+        "Baixar lista (HTML)",
+        data=campanha_html(lista).encode("utf-8"),
+        file_name=f"campanha_whatsapp_{sufixo}.html",
+        mime="text/html",
+    )
+
+
 def pagina_etiquetas_qrcode(aba_pacientes):
     botao_voltar_menu()
     hero("Etiquetas com QR Code", "Gere etiquetas por família em PDF.")
-    df = garantir_colunas_pacientes(carregar_dados_aba(aba_pacientes))
-    if df.empty:
+    indice = indice_familias(aba_pacientes)
+    if indice.quadro.empty:
         st.warning("Ainda não há dados.")
         return
 
-    df_familias = df[df["FAMÍLIA"].astype(str).str.strip() != ""].copy()
-    if df_familias.empty:
+    if not indice.ordenadas:
         st.warning("Não há famílias para exibir.")
         return
 
-    def agregador(x):
-        return {
-            "membros": x[["Nome Completo", "Data de Nascimento", "CNS"]].to_dict("records"),
-            "link_pasta": x["Link da Pasta da Família"].iloc[0] if "Link da Pasta da Família" in x.columns else "",
-        }
-
-    familias_dict = df_familias.groupby("FAMÍLIA").apply(agregador).to_dict()
-    lista_familias = sorted([f for f in familias_dict.keys() if f])
-
-    selecionadas = st.multiselect("Selecione as famílias", lista_familias)
-    familias_para_gerar = familias_dict if not selecionadas else {fid: familias_dict[fid] for fid in selecionadas}
+    selecionadas = st.multiselect(
+        "Selecione as famílias",
+        indice.ordenadas,
+        format_func=lambda familia: f"{familia} ({indice.membros[familia]} membro(s))",
+    )
+    if not selecionadas:
+        st.caption(f"Nenhuma família selecionada: o PDF terá as etiquetas das {len(indice.ordenadas)} famílias.")
 
-    for familia_id, dados_familia in familias_para_gerar.items():
-        with st.expander(f"Família: {familia_id} ({len(dados_familia['membros'])} membro(s))"):
-            for membro in dados_familia["membros"]:
+    for familia_id in selecionadas:
+        with st.expander(f"Família: {familia_id} ({indice.membros[familia_id]} membro(s))"):
+            for membro in indice.membros_familia(familia_id):
                 st.write(f"**{membro['Nome Completo']}**")
                 st.caption(f"DN: {membro['Data de Nascimento']} | CNS: {membro['CNS']}")
 
     if st.button("Gerar PDF das Etiquetas"):
-        pdf_bytes = gerar_pdf_etiquetas(familias_para_gerar)
+        pdf_bytes = gerar_pdf_etiquetas(indice.para_etiquetas(selecionadas or indice.ordenadas))
         st.download_button(
             label="Baixar PDF",
             data=pdf_bytes,
@@ -1549,48 +3501,88 @@ def pagina_capas_prontuario(aba_pacientes):
         st.warning("Ainda não há dados.")
         return
 
-    lista_pacientes = sorted(df["Nome Completo"].tolist())
-    selecionados = st.multiselect("Escolha um ou mais pacientes", lista_pacientes)
-    if not selecionados:
-        return
-
-    pacientes_df = df[df["Nome Completo"].isin(selecionados)]
-    st.dataframe(
-        pacientes_df[["Nome Completo", "Data de Nascimento", "FAMÍLIA", "CPF", "CNS"]],
-        use_container_width=True,
-    )
+    if st.toggle(f"Gerar para todos os {len(df)} pacientes"):
+        pacientes_df = df.sort_values("Nome Completo")
+    else:
+        lista_pacientes = sorted(df["Nome Completo"].tolist())
+        selecionados = st.multiselect("Escolha um ou mais pacientes", lista_pacientes)
+        if not selecionados:
+            return
+        pacientes_df = df[df["Nome Completo"].isin(selecionados)]
+        st.dataframe(
+            pacientes_df[["Nome Completo", "Data de Nascimento", "FAMÍLIA", "CPF", "CNS"]],
+            use_container_width=True,
+        )
 
     if st.button("Gerar PDF das Capas"):
-        pdf_bytes = gerar_pdf_capas_prontuario(pacientes_df)
-        st.download_button(
-            label="Baixar PDF das Capas",
-            data=pdf_bytes,
-            file_name=f"capas_prontuario_{datetime.now().strftime('%Y%m%d')}.pdf",
-            mime="application/pdf",
-        )
+        anterior = st.session_state.pop("capas_arquivo", None)
+        if anterior is not None:
+            anterior.close()
+        sufixo = datetime.now().strftime("%Y%m%d")
+        if len(pacientes_df) > TAMANHO_LOTE_CAPAS:
+            with st.spinner(f"Gerando {len(pacientes_df)} capas em lotes..."):
+                st.session_state["capas_arquivo"] = gerar_pdf_capas_em_lotes(pacientes_df)
+            st.download_button(
+                label=f"Baixar capas (ZIP com um PDF a cada {TAMANHO_LOTE_CAPAS} pacientes)",
+                data=partial(ler_arquivo, st.session_state["capas_arquivo"]),
+                file_name=f"capas_prontuario_{sufixo}.zip",
+                mime="application/zip",
+            )
+        else:
+            st.download_button(
+                label="Baixar PDF das Capas",
+                data=gerar_pdf_capas_prontuario(pacientes_df),
+                file_name=f"capas_prontuario_{sufixo}.pdf",
+                mime="application/pdf",
+            )
 
 
 def pagina_gerar_documentos(aba_pacientes):
     botao_voltar_menu()
     hero("Gerar Documentos", "Preencha formulário PDF a partir do paciente.")
-    df = garantir_colunas_pacientes(carregar_dados_aba(aba_pacientes))
-    if df.empty:
+    indice = indice_pacientes(aba_pacientes)
+    if indice.quadro.empty:
         st.warning("Não há pacientes cadastrados.")
         return
 
-    paciente_nome = st.selectbox("Escolha um paciente", sorted(df["Nome Completo"].tolist()), index=None)
-    if not paciente_nome:
+    paciente_id = selecionar_paciente(indice, "Escolha um paciente", index=None)
+    if paciente_id:
+        paciente_dados = buscar_dados_paciente(indice, paciente_id)
+        if st.button("Gerar Formulário de Vulnerabilidade"):
+            pdf_buffer = preencher_pdf_formulario(paciente_dados)
+            if pdf_buffer:
+                st.download_button(
+                    label="Baixar Formulário (PDF)",
+                    data=pdf_buffer,
+                    file_name=f"formulario_{str(paciente_dados['Nome Completo']).replace(' ', '_')}.pdf",
+                    mime="application/pdf",
+                )
+
+    st.markdown("---")
+    st.subheader("Formulários em lote")
+    c1, c2 = st.columns(2)
+    idade_minima = c1.number_input("Idade mínima", min_value=0, max_value=120, value=IDADE_MINIMA_IVCF, step=1)
+    formato = c2.selectbox(
+        "Formato",
+        ["PDF único", "ZIP com um PDF por paciente"],
+        help="O PDF único compartilha o modelo entre as páginas; no ZIP cada arquivo traz o modelo completo.",
+    )
+    df = indice.quadro
+    pacientes = df[(df["Idade"] >= idade_minima).fillna(False).astype(bool)].sort_values("Nome Completo")
+    st.markdown(f"**{len(pacientes)}** paciente(s) com {idade_minima} anos ou mais.")
+    if pacientes.empty:
         return
 
-    paciente_dados = df[df["Nome Completo"] == paciente_nome].iloc[0].to_dict()
-    if st.button("Gerar Formulário de Vulnerabilidade"):
-        pdf_buffer = preencher_pdf_formulario(paciente_dados)
-        if pdf_buffer:
+    if st.button("Gerar Formulários em Lote"):
+        compactar = formato != "PDF único"
+        with st.spinner(f"Gerando {len(pacientes)} formulários..."):
+            arquivo = preencher_formularios_em_lote(pacientes.to_dict("records"), compactar)
+        if arquivo:
             st.download_button(
-                label="Baixar Formulário (PDF)",
-                data=pdf_buffer,
-                file_name=f"formulario_{paciente_nome.replace(' ', '_')}.pdf",
-                mime="application/pdf",
+                label="Baixar Formulários",
+                data=arquivo,
+                file_name=f"formularios_ivcf20_{datetime.now().strftime('%Y%m%d')}.{'zip' if compactar else 'pdf'}",
+                mime="application/zip" if compactar else "application/pdf",
             )
 
 
@@ -1657,15 +3649,15 @@ def pagina_importar_prontuario(aba_pacientes, gemini_client):
         st.warning("GOOGLE_API_KEY ausente ou Gemini indisponível.")
         return
 
-    df = garantir_colunas_pacientes(carregar_dados_aba(aba_pacientes))
-    if df.empty:
+    indice = indice_pacientes(aba_pacientes)
+    if indice.quadro.empty:
         st.warning("Não há pacientes na base.")
         return
 
-    paciente_nome = st.selectbox("Selecione o paciente", sorted(df["Nome Completo"].tolist()), index=None)
+    paciente_id = selecionar_paciente(indice, "Selecione o paciente", index=None)
     uploaded_file = st.file_uploader("Carregue o prontuário em PDF", type=["pdf"])
 
-    if not paciente_nome or not uploaded_file:
+    if not paciente_id or not uploaded_file:
         return
 
     if st.button("Iniciar extração do prontuário"):
@@ -1697,10 +3689,16 @@ def pagina_importar_prontuario(aba_pacientes, gemini_client):
         salvar = st.form_submit_button("Salvar no paciente")
 
         if salvar:
-            paciente_row = df[df["Nome Completo"] == paciente_nome].iloc[0].to_dict()
+            paciente_row = buscar_dados_paciente(indice_pacientes(aba_pacientes), paciente_id)
+            if paciente_row is None:
+                st.error("Paciente não encontrado; ele pode ter sido excluído.")
+                return
             paciente_row["Condição"] = ", ".join(diagnosticos_validados)
             paciente_row["Medicamentos"] = ", ".join(medicamentos_validados)
-            atualizar_paciente_por_id(aba_pacientes, paciente_row["ID"], paciente_row)
+            registrar_escrita(
+                atualizar_paciente_por_id(aba_pacientes, paciente_id, paciente_row),
+                f"Dados clínicos de {paciente_row['Nome Completo']}",
+            )
             st.success("Paciente atualizado com dados clínicos.")
             st.rerun()
 
@@ -1716,6 +3714,8 @@ def pagina_gerador_qrcode():
     st.success(f"URL: {dashboard_url}")
 
     if st.button("Gerar QR Code"):
+        import qrcode
+
         qr = qrcode.QRCode(version=1, box_size=10, border=4)
         qr.add_data(dashboard_url)
         qr.make(fit=True)
@@ -1764,6 +3764,26 @@ def pagina_gerador_cards(gemini_client):
         st.text_area("Mensagem completa", value=mensagem_final, height=280)
 
 
+def pagina_metricas_planilha():
+    botao_voltar_menu()
+    hero("Métricas da Planilha", "Chamadas feitas à planilha desde que o servidor iniciou e a cota disponível.")
+    controle = controle_cota()
+    resumo, fichas = controle.resumo()
+    m1, m2, m3 = st.columns(3)
+    with m1:
+        metric_card("Cota por minuto", controle.capacidade)
+    with m2:
+        metric_card("Chamadas disponíveis agora", int(fichas))
+    with m3:
+        metric_card("Leituras coalescidas", int(resumo["Coalescidas"].sum()) if not resumo.empty else 0)
+    if resumo.empty:
+        st.info("Nenhuma chamada à planilha foi feita desde que o servidor iniciou.")
+        return
+    st.dataframe(resumo, use_container_width=True, hide_index=True)
+    if st.button("🔄 Atualizar"):
+        st.rerun()
+
+
 def pagina_kanban(aba_kanban):
     botao_voltar_menu()
     hero("Kanban", "Controle visual de tarefas com checklist, comentários e prazo.")
@@ -1775,7 +3795,7 @@ def pagina_kanban(aba_kanban):
     backlog = len(df[df["Status"] == "Backlog"])
     andamento = len(df[df["Status"] == "Em Andamento"])
     concluidas = len(df[df["Status"] == "Concluído"])
-    atrasadas = sum(1 for _, row in df.iterrows() if tarefa_atrasada(row))
+    atrasadas = int(tarefas_atrasadas(df).sum())
 
     m1, m2, m3, m4 = st.columns(4)
     with m1:
@@ -1830,7 +3850,7 @@ def pagina_kanban(aba_kanban):
                         "Criado em": agora,
                         "Atualizado em": agora,
                     }
-                    salvar_tarefa(aba_kanban, tarefa)
+                    registrar_escrita(salvar_tarefa(aba_kanban, tarefa), f"Tarefa {tarefa['Título']}")
                     st.success("Tarefa salva com sucesso.")
                     st.rerun()
 
@@ -1903,12 +3923,7 @@ def pagina_kanban(aba_kanban):
                                     key=f"prio_{row['ID']}",
                                 )
 
-                            prazo_valor = None
-                            try:
-                                if str(row["Prazo"]).strip():
-                                    prazo_valor = datetime.strptime(str(row["Prazo"]), "%d/%m/%Y").date()
-                            except Exception:
-                                prazo_valor = None
+                            prazo_valor = row["_prazo"].date() if pd.notna(row["_prazo"]) else None
 
                             novo_prazo = st.date_input("Prazo", value=prazo_valor, key=f"prazo_{row['ID']}")
 
@@ -1959,12 +3974,15 @@ def pagina_kanban(aba_kanban):
                                     "Criado em": row["Criado em"],
                                     "Atualizado em": agora,
                                 }
-                                atualizar_tarefa_por_id(aba_kanban, row["ID"], novos_dados)
+                                registrar_escrita(
+                                    atualizar_tarefa_por_id(aba_kanban, row["ID"], novos_dados),
+                                    f"Tarefa {novos_dados['Título']}",
+                                )
                                 st.success("Tarefa atualizada.")
                                 st.rerun()
 
                             if excluir:
-                                excluir_tarefa_por_id(aba_kanban, row["ID"])
+                                registrar_escrita(excluir_tarefa_por_id(aba_kanban, row["ID"]), f"Exclusão de {row['Título']}")
                                 st.success("Tarefa excluída.")
                                 st.rerun()
 
@@ -1978,10 +3996,8 @@ def main():
     if "pagina" not in st.session_state:
         st.session_state["pagina"] = "menu"
 
-    planilha = conectar_planilha()
-    aba_pacientes = obter_aba_pacientes(planilha)
-    aba_kanban = obter_ou_criar_aba(planilha, "KANBAN", COLUNAS_KANBAN)
-    gemini_client = cliente_gemini()
+    aba_pacientes, aba_kanban = abrir_armazenamentos()
+    iniciar_reprodutor_diario({"pacientes": aba_pacientes, "kanban": aba_kanban}, TIPO_ARMAZENAMENTO)
 
     with st.sidebar:
         st.title("Navegação")
@@ -1990,6 +4006,7 @@ def main():
             "🤖 Coletar Fichas",
             "👥 Cadastro de Pacientes",
             "🔎 Gestão de Pacientes",
+            "🧬 Cadastros Duplicados",
             "📊 Dashboard de Pacientes",
             "📱 WhatsApp Manual",
             "🏷️ Etiquetas QR Code",
@@ -2000,6 +4017,7 @@ def main():
             "🧠 Cards de Saúde com IA",
             "🔳 Gerador de QR Code",
             "📋 Kanban",
+            "📈 Métricas da Planilha",
         ]
         escolha = st.radio(
             "Escolha a página:",
@@ -2009,17 +4027,20 @@ def main():
         if escolha != st.session_state["pagina"]:
             st.session_state["pagina"] = escolha
             st.rerun()
+        mostrar_status_escritas()
 
     pagina = st.session_state["pagina"]
 
     if pagina == "menu":
         pagina_menu(aba_pacientes, aba_kanban)
     elif pagina == "🤖 Coletar Fichas":
-        pagina_coletar_fichas(aba_pacientes, gemini_client)
+        pagina_coletar_fichas(aba_pacientes, cliente_gemini())
     elif pagina == "👥 Cadastro de Pacientes":
         pagina_cadastro_pacientes(aba_pacientes)
     elif pagina == "🔎 Gestão de Pacientes":
         pagina_gestao_pacientes(aba_pacientes)
+    elif pagina == "🧬 Cadastros Duplicados":
+        pagina_duplicidades(aba_pacientes)
     elif pagina == "📊 Dashboard de Pacientes":
         pagina_dashboard_pacientes(aba_pacientes)
     elif pagina == "📱 WhatsApp Manual":
@@ -2031,15 +4052,17 @@ def main():
     elif pagina == "📄 Gerar Documentos":
         pagina_gerar_documentos(aba_pacientes)
     elif pagina == "💉 Análise de Vacinação":
-        pagina_analise_vacinacao(gemini_client)
+        pagina_analise_vacinacao(cliente_gemini())
     elif pagina == "📄 Importar Prontuário":
-        pagina_importar_prontuario(aba_pacientes, gemini_client)
+        pagina_importar_prontuario(aba_pacientes, cliente_gemini())
     elif pagina == "🧠 Cards de Saúde com IA":
-        pagina_gerador_cards(gemini_client)
+        pagina_gerador_cards(cliente_gemini())
     elif pagina == "🔳 Gerador de QR Code":
         pagina_gerador_qrcode()
     elif pagina == "📋 Kanban":
         pagina_kanban(aba_kanban)
+    elif pagina == "📈 Métricas da Planilha":
+        pagina_metricas_planilha()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,18 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+os.environ.setdefault("COLETA_ARMAZENAMENTO", "memoria")
+os.environ.setdefault("COLETA_ESPELHO_SQLITE", os.path.join(tempfile.mkdtemp(), "espelho.sqlite3"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def estado_novo():
+    import streamlit_app
+
+    streamlit_app.fila_escrita.clear()
+    for tabela in ("pacientes", "kanban"):
+        streamlit_app.invalidar_aba(tabela)
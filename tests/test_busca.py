@@ -0,0 +1,33 @@
+import pandas as pd
+import pytest
+
+import streamlit_app as app
+
+
+@pytest.fixture
+def indice():
+    linhas = [
+        {"ID": "1", "Nome Completo": "João Silva", "CPF": "123.456.789-09"},
+        {"ID": "2", "Nome Completo": "Ana Ribeiro", "CPF": "987.654.321-00"},
+        {"ID": "3", "Nome Completo": "Carlos Rocha", "CPF": ""},
+    ]
+    quadro = pd.DataFrame([{**{col: "" for col in app.COLUNAS_PACIENTES}, **linha} for linha in linhas])
+    return app.IndiceBusca(app.garantir_colunas_pacientes(app.tipar_quadro("pacientes", quadro)))
+
+
+def nomes(indice, termo):
+    return indice.quadro["Nome Completo"].iloc[indice.buscar(termo)].tolist()
+
+
+def test_busca_ignora_acentos(indice):
+    assert nomes(indice, "Joao") == ["João Silva"]
+
+
+def test_busca_tolera_letras_trocadas(indice):
+    assert nomes(indice, "Riberio") == ["Ana Ribeiro"]
+    assert nomes(indice, "Carlso") == ["Carlos Rocha"]
+
+
+def test_busca_encontra_trecho_do_meio_do_cpf(indice):
+    assert nomes(indice, "456789") == ["João Silva"]
+    assert nomes(indice, "654.321") == ["Ana Ribeiro"]
@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+
+import pytest
+
+import streamlit_app as app
+
+
+class ErroApi(Exception):
+    def __init__(self, code, status_code):
+        self.code = code
+        self.response = SimpleNamespace(status_code=status_code)
+
+
+def test_codigo_erro_prefere_o_status_http_da_resposta():
+    assert app.codigo_erro(ErroApi(-1, 502)) == 502
+    assert app.codigo_erro(app.ErroCotaSimulada()) == 429
+    assert app.codigo_erro(ValueError()) is None
+
+
+def test_erro_5xx_sem_corpo_json_e_repetido_em_leituras():
+    tentativas = []
+
+    def ler():
+        tentativas.append(1)
+        if len(tentativas) < 3:
+            raise ErroApi(-1, 502)
+        return "ok"
+
+    controle = app.ControleCota(tentativas=3, espera_base=0, espera_maxima=0)
+    assert controle.executar("get_all_values", ler) == "ok"
+    assert len(tentativas) == 3
+
+
+def test_erro_5xx_nao_e_repetido_em_escritas_nao_idempotentes():
+    def anexar():
+        raise ErroApi(-1, 502)
+
+    controle = app.ControleCota(tentativas=3, espera_base=0, espera_maxima=0)
+    with pytest.raises(ErroApi):
+        controle.executar("append_rows", anexar, idempotente=False)
@@ -0,0 +1,86 @@
+import pytest
+
+import streamlit_app as app
+
+
+def paciente(registro_id, nome):
+    dados = {col: "" for col in app.COLUNAS_PACIENTES}
+    dados.update({"ID": registro_id, "Nome Completo": nome})
+    return dados
+
+
+def linha_paciente(registro_id, nome):
+    dados = paciente(registro_id, nome)
+    return [dados[col] for col in app.COLUNAS_PACIENTES]
+
+
+@pytest.fixture
+def aba():
+    falsa = app.AbaFalsa("Página1", app.COLUNAS_PACIENTES, [linha_paciente(f"P{i}", f"Paciente {i}") for i in range(1, 4)])
+    armazenamento = app.ArmazenamentoPlanilha(falsa, controle=app.ControleCota())
+    app.sincronizar_espelho(armazenamento)
+    return armazenamento
+
+
+@pytest.fixture
+def fila(aba):
+    return app.FilaEscrita(aba)
+
+
+def test_anexos_sao_enviados_em_uma_chamada(aba, fila):
+    escritas = [fila.anexar(paciente(f"N{i}", f"Novo {i}")) for i in range(3)]
+    fila.descarregar()
+
+    assert aba.aba.chamadas["append_rows"] == 1
+    assert [e.estado for e in escritas] == ["gravado"] * 3
+    assert [e.linha for e in escritas] == [5, 6, 7]
+    assert [linha[0] for linha in aba.aba.valores[4:]] == ["N0", "N1", "N2"]
+
+
+def test_atualizacoes_sao_enviadas_em_uma_chamada(aba, fila):
+    escritas = [
+        fila.atualizar("P1", paciente("P1", "Paciente Um"), linha_prevista=2),
+        fila.atualizar("P3", paciente("P3", "Paciente Três"), linha_prevista=4),
+    ]
+    fila.descarregar()
+
+    assert aba.aba.chamadas["batch_update"] == 1
+    assert [(e.estado, e.linha) for e in escritas] == [("gravado", 2), ("gravado", 4)]
+    assert aba.aba.valores[1][2] == "Paciente Um"
+    assert aba.aba.valores[2][2] == "Paciente 2"
+    assert aba.aba.valores[3][2] == "Paciente Três"
+
+
+def test_atualizacao_relocaliza_linha_que_mudou_de_lugar(aba, fila):
+    aba.aba.delete_rows(2)
+    escrita = fila.atualizar("P3", paciente("P3", "Paciente Três"), linha_prevista=4)
+    fila.descarregar()
+
+    assert (escrita.estado, escrita.linha) == ("gravado", 3)
+    assert aba.aba.valores[1][2] == "Paciente 2"
+    assert aba.aba.valores[2][:3] == ["P3", "", "Paciente Três"]
+
+
+def test_erro_da_planilha_chega_as_escritas(aba, fila, monkeypatch):
+    def recusar(*args, **kwargs):
+        raise RuntimeError("planilha indisponível")
+
+    monkeypatch.setattr(aba.aba, "append_rows", recusar)
+    anexos = [fila.anexar(paciente(f"N{i}", f"Novo {i}")) for i in range(2)]
+    ausente = fila.atualizar("NAO-EXISTE", paciente("NAO-EXISTE", "Ninguém"))
+    fila.descarregar()
+
+    assert [(e.estado, e.erro) for e in anexos] == [("erro", "planilha indisponível")] * 2
+    assert (ausente.estado, ausente.erro) == ("erro", "Registro não encontrado na planilha.")
+    assert len(aba.aba.valores) == 4
+
+
+def test_descarregar_esvazia_a_fila(aba, fila):
+    escritas = [fila.anexar(paciente("N1", "Novo 1")), fila.atualizar("P2", paciente("P2", "Paciente Dois"))]
+    assert len(fila.pendentes) == 2
+
+    assert fila.descarregar() == escritas
+    assert fila.pendentes == []
+    assert all(e.estado == "gravado" for e in escritas)
+    assert fila.descarregar() == []
+    assert aba.aba.chamadas["append_rows"] == 1
@@ -0,0 +1,47 @@
+import pandas as pd
+
+import streamlit_app as app
+
+
+def test_indice_pacientes_mantem_primeira_linha_de_id_repetido():
+    quadro = pd.DataFrame({
+        "ID": ["A", "B", "A"],
+        "Nome Completo": ["Primeira", "Outra", "Repetida"],
+        "Data de Nascimento": ["01/01/1990", "", "02/02/2000"],
+    })
+    indice = app.IndicePacientes(quadro)
+
+    assert indice.ids == {"A": 0, "B": 1}
+    assert indice.paciente("A")["Nome Completo"] == "Primeira"
+    assert indice.ordenados == ["B", "A"]
+    assert indice.rotulo("A") == "Primeira · Nasc.: 01/01/1990 · ID: A"
+
+
+def test_indice_familias_agrupa_pelo_valor_original_e_ignora_vazias():
+    quadro = pd.DataFrame({
+        "FAMÍLIA": ["", "F1", "F1 ", "  ", "F2", "F1"],
+        "Link da Pasta da Família": ["-", "a", "b", "-", "d", "e"],
+        "Nome Completo": ["Sem", "Ana", "Bia", "Sem", "Caio", "Duda"],
+        "Data de Nascimento": [""] * 6,
+        "CNS": [""] * 6,
+    })
+    indice = app.IndiceFamilias(quadro)
+
+    assert indice.ordenadas == ["F1", "F1 ", "F2"]
+    etiquetas = indice.para_etiquetas(["F1", "F2"])
+    assert [m["Nome Completo"] for m in etiquetas["F1"]["membros"]] == ["Ana", "Duda"]
+    assert (etiquetas["F1"]["link_pasta"], etiquetas["F2"]["link_pasta"]) == ("a", "d")
+
+
+def test_indices_da_mesma_versao_compartilham_o_quadro():
+    linhas = [[f"P{i}" if col == "ID" else "" for col in app.COLUNAS_PACIENTES] for i in range(3)]
+    aba = app.ArmazenamentoPlanilha(app.AbaFalsa("Página1", app.COLUNAS_PACIENTES, linhas), controle=app.ControleCota())
+    app.sincronizar_espelho(aba)
+
+    quadro = app.indice_pacientes(aba).quadro
+    assert all(
+        indice.quadro is quadro
+        for indice in [app.indice_busca_pacientes(aba), app.motor_duplicatas(aba), app.indice_familias(aba), app.painel_pacientes(aba)]
+    )
+    app.invalidar_aba("pacientes")
+    assert app.indice_pacientes(aba).quadro is not quadro
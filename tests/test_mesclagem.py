@@ -0,0 +1,29 @@
+import streamlit_app as app
+
+
+def paciente(registro_id, nome, **campos):
+    dados = {col: "" for col in app.COLUNAS_PACIENTES}
+    dados.update({"ID": registro_id, "Nome Completo": nome}, **campos)
+    return [dados[col] for col in app.COLUNAS_PACIENTES]
+
+
+def test_mesclagem_remove_linhas_que_repetem_o_id_mantido():
+    falsa = app.AbaFalsa("Página1", app.COLUNAS_PACIENTES, [
+        paciente("P1", "Maria Souza"),
+        paciente("P2", "Maria Souza", Sexo="F"),
+        paciente("P1", "Maria Souza", **{"Nome da Mãe": "Ana Souza"}),
+        paciente("P4", "Outra Pessoa"),
+    ])
+    aba = app.ArmazenamentoPlanilha(falsa, controle=app.ControleCota())
+    app.sincronizar_espelho(aba)
+    quadro = app.carregar_dados_aba(aba)
+
+    app.mesclar_pacientes(aba, quadro.iloc[[0, 1, 2]], "P1")
+    while app.processar_diario({"pacientes": aba}):
+        pass
+
+    colunas = app.COLUNAS_PACIENTES
+    assert [linha[0] for linha in falsa.valores[1:]] == ["P1", "P4"]
+    mantido = dict(zip(colunas, falsa.valores[1]))
+    assert (mantido["Sexo"], mantido["Nome da Mãe"]) == ("F", "Ana Souza")
+    assert app.carregar_dados_aba(aba)["ID"].tolist() == ["P1", "P4"]
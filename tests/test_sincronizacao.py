@@ -0,0 +1,32 @@
+import streamlit_app as app
+
+
+def paciente(registro_id, nome):
+    dados = {col: "" for col in app.COLUNAS_PACIENTES}
+    dados.update({"ID": registro_id, "Nome Completo": nome})
+    return dados
+
+
+def test_sincronizacao_preserva_escritas_feitas_durante_a_leitura(monkeypatch):
+    falsa = app.AbaFalsa("Página1", app.COLUNAS_PACIENTES, [[paciente("P1", "Paciente 1")[col] for col in app.COLUNAS_PACIENTES]])
+    aba = app.ArmazenamentoPlanilha(falsa, controle=app.ControleCota())
+    app.sincronizar_espelho(aba)
+    ler_todos = aba.ler_todos
+
+    def ler_enquanto_cadastra():
+        valores = ler_todos()
+        app.salvar_paciente(aba, paciente("N1", "Novo 1"), permitir_duplicata=True)
+        app.atualizar_paciente_por_id(aba, "P1", paciente("P1", "Paciente Um"))
+        return valores
+
+    monkeypatch.setattr(aba, "ler_todos", ler_enquanto_cadastra)
+    assert not app.sincronizar_espelho(aba)
+    monkeypatch.setattr(aba, "ler_todos", ler_todos)
+
+    quadro = app.carregar_dados_aba(aba)
+    assert quadro["ID"].tolist() == ["P1", "N1"]
+    assert quadro["Nome Completo"].tolist() == ["Paciente Um", "Novo 1"]
+
+    while app.processar_diario({"pacientes": aba}):
+        pass
+    assert [linha[2] for linha in falsa.valores[1:]] == ["Paciente Um", "Novo 1"]